@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from src.minesweeper_controller import CELL_CODES, MinesweeperBotWeb, classify_cells
+from src.minesweeper_engine import generate_board
+
+# Размеры поля для замеров: новичок, любитель, профессионал и крупное поле
+BOARD_SIZES = ((8, 8, 10), (16, 16, 40), (16, 30, 99), (32, 64, 400))
+
+
+def _metric(value, unit, better="higher", **extra):
+    return {"value": float(value), "unit": unit, "better": better, **extra}
+
+
+def _latency_metric(samples):
+    """Латентность по выборке замеров в секундах: медиана в значении, хвосты рядом"""
+    samples = np.asarray(samples) * 1000
+    return _metric(np.percentile(samples, 50), "ms", better="lower",
+                   p95=float(np.percentile(samples, 95)), p99=float(np.percentile(samples, 99)))
+
+
+def _random_policy_steps(env, steps, seed):
+    """steps шагов случайной политики по закрытым клеткам; возвращает (steps/sec, resets/sec)"""
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed)
+    resets, reset_time = 0, 0.0
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, terminated, _, _ = env.step(rng.choice(np.flatnonzero(env.action_masks())))
+        if terminated:
+            reset_start = time.perf_counter()
+            env.reset()
+            reset_time += time.perf_counter() - reset_start
+            resets += 1
+    total = time.perf_counter() - start
+    return steps / (total - reset_time), resets / reset_time if reset_time else 0.0
+
+
+def bench_env(backend, steps, seed, results):
+    from src.learning.ppo_env.sweeper_env_ppo import MinesweeperEnv
+
+    for height, width, mines in BOARD_SIZES[:3]:
+        env = MinesweeperEnv(backend=backend, headless=True, show_overlay=False, height=height, width=width, mines=mines)
+        try:
+            steps_per_sec, resets_per_sec = _random_policy_steps(env, steps, seed)
+        finally:
+            env.close()
+        key = f"env.{backend}.{height}x{width}"
+        results[f"{key}.steps_per_sec"] = _metric(steps_per_sec, "steps/s")
+        results[f"{key}.resets_per_sec"] = _metric(resets_per_sec, "resets/s")
+
+
+def bench_vec_env(num_envs, steps, seed, results):
+    from src.learning.ppo_env.sweeper_vec_env import MinesweeperVecEnv
+
+    env = MinesweeperVecEnv(num_envs=num_envs, seed=seed)
+    rng = np.random.default_rng(seed)
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        masks = env.action_masks()
+        # Случайная закрытая клетка в каждой доске: argmax случайных чисел под маской
+        env.step(np.argmax(rng.random(masks.shape) * masks, axis=1))
+    results[f"vec_env.engine.{num_envs}.steps_per_sec"] = _metric(num_envs * steps / (time.perf_counter() - start),
+                                                                  "steps/s")
+
+
+def bench_field_state(repeats, seed, results):
+    """
+    Стоимость чтения страницы в зависимости от размера поля: полное чтение readField,
+    перезапуск игры (загрузка страницы и полное чтение) и первый клик с чтением изменений.
+    Повторное чтение изменений без клика не замеряется: MutationObserver отдаёт пустую разницу.
+    """
+    rng = np.random.default_rng(seed)
+    for height, width, mines in BOARD_SIZES:
+        bot = MinesweeperBotWeb(headless=True, height=height, width=width, mines=mines)
+        bot.start_game()
+        try:
+            restart, click, read = [], [], []
+            for _ in range(repeats):
+                board = generate_board(rng, height, width, mines)
+                start = time.perf_counter()
+                bot.restart_game(board=board)
+                restart.append(time.perf_counter() - start)
+                # Первый клик безопасен (мина с этой клетки переезжает на запасную позицию)
+                # и открывает часть поля, как в середине партии
+                start = time.perf_counter()
+                bot.left_click_and_observe(height // 2, width // 2)
+                click.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                bot.read_field()
+                read.append(time.perf_counter() - start)
+            results[f"controller.read_field.{height}x{width}"] = _latency_metric(read)
+            results[f"controller.restart_game.{height}x{width}"] = _latency_metric(restart)
+            results[f"controller.left_click_and_observe.{height}x{width}"] = _latency_metric(click)
+        finally:
+            bot.close_game()
+
+
+def bench_cell_state(count, seed, results):
+    """Стоимость классификации класса клетки в код на стороне Python: по одной и пакетом на всё поле"""
+    bot = MinesweeperBotWeb()
+    sample = np.random.default_rng(seed).choice(list(CELL_CODES) + ["question"], size=count).tolist()
+    start = time.perf_counter()
+    for class_attr in sample:
+        bot.get_cell_state(class_attr)
+    results["controller.get_cell_state.per_cell"] = _metric((time.perf_counter() - start) / count * 1e9, "ns",
+                                                           better="lower")
+    start = time.perf_counter()
+    classify_cells(sample)
+    results["controller.classify_cells.per_cell"] = _metric((time.perf_counter() - start) / count * 1e9, "ns",
+                                                           better="lower")
+
+
+def bench_rollout(n_envs, n_steps, seed, results):
+    """Сбор одного роллаута PPO (инференс политики + шаги окружения) без шага оптимизации"""
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.utils import set_random_seed
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from src.learning.ppo_env.sweeper_env_ppo import MinesweeperEnv
+    from src.learning.ppo_env.sweeper_vec_env import MinesweeperVecEnv
+
+    set_random_seed(seed)
+    envs = {
+        "engine_single": DummyVecEnv([lambda: MinesweeperEnv(backend="engine", show_overlay=False)]),
+        f"engine_vec_{n_envs}": MinesweeperVecEnv(num_envs=n_envs, seed=seed),
+    }
+    for name, env in envs.items():
+        model = PPO("MultiInputPolicy", env, n_steps=n_steps, batch_size=n_steps * env.num_envs, seed=seed,
+                    device="cpu")
+        _, callback = model._setup_learn(n_steps * env.num_envs, callback=None)
+        callback.on_training_start(locals(), globals())
+        start = time.perf_counter()
+        model.collect_rollouts(model.env, callback, model.rollout_buffer, n_rollout_steps=n_steps)
+        elapsed = time.perf_counter() - start
+        results[f"rollout.ppo.{name}.steps_per_sec"] = _metric(n_steps * env.num_envs / elapsed, "steps/s")
+        env.close()
+
+
+def _run(name, function, args, results, skipped):
+    try:
+        function(*args, results)
+    except Exception as e:
+        # Браузера может не быть (CI, headless-сервер) — остальные замеры от этого не зависят
+        skipped[name] = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+
+
+def run(seed=0, quick=False, browser=True):
+    scale = 0.1 if quick else 1.0
+    results, skipped = {}, {}
+    _run("env.engine", bench_env, ("engine", int(20000 * scale), seed), results, skipped)
+    _run("vec_env.engine", bench_vec_env, (256, int(2000 * scale), seed), results, skipped)
+    _run("controller.get_cell_state", bench_cell_state, (int(1000000 * scale), seed), results, skipped)
+    _run("rollout.ppo", bench_rollout, (64, int(2048 * scale), seed), results, skipped)
+    if browser:
+        _run("env.browser", bench_env, ("browser", int(500 * scale), seed), results, skipped)
+        _run("controller.get_field_state", bench_field_state, (int(200 * scale), seed), results, skipped)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "seed": seed,
+            "quick": quick,
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(report, baseline, tolerance, allow_missing=False):
+    """
+    Сравнение с сохранённым прогоном: метрика хуже базовой больше чем на tolerance (доля) — регрессия.
+    Метрика базового прогона, которой нет в текущем (замер упал или пропущен), тоже считается регрессией,
+    если не задан allow_missing.
+    :return: список строк с регрессиями.
+    """
+    regressions = []
+    for name, metric in baseline["results"].items():
+        current = report["results"].get(name)
+        if current is None:
+            if not allow_missing:
+                reason = next((reason for group, reason in report["skipped"].items() if name.startswith(group)),
+                              "not measured")
+                regressions.append(f"{name}: missing from this run ({reason})")
+            continue
+        if not metric["value"]:
+            continue
+        ratio = current["value"] / metric["value"]
+        change = ratio - 1 if metric["better"] == "higher" else 1 - ratio
+        current["baseline"] = metric["value"]
+        current["change"] = change
+        if change < -tolerance:
+            regressions.append(f"{name}: {current['value']:.4g} {metric['unit']} vs baseline "
+                               f"{metric['value']:.4g} ({change:+.1%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark env throughput, controller latency and PPO rollout collection.")
+    parser.add_argument('--output', type=str, default="benchmark.json", help="Write the results as JSON to this file.")
+    parser.add_argument('--baseline', type=str, default=None, help="Compare against a previous results file and exit with code 1 on regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed relative slowdown against the baseline.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for boards, policies and model initialization.")
+    parser.add_argument('--quick', action='store_true', help="Run 10x fewer iterations, for a smoke check.")
+    parser.add_argument('--no_browser', action='store_true', help="Skip benchmarks that need Chromium.")
+    parser.add_argument('--allow_missing', action='store_true', help="Do not fail when a baseline metric is missing from this run (skipped or crashed benchmark).")
+    args = parser.parse_args()
+
+    report = run(args.seed, args.quick, not args.no_browser)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.allow_missing)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, metric in report["results"].items():
+        change = f" ({metric['change']:+.1%})" if "change" in metric else ""
+        print(f"{name}: {metric['value']:.4g} {metric['unit']}{change}")
+    for name, reason in report["skipped"].items():
+        print(f"skipped {name}: {reason}")
+    if regressions:
+        print("Regressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
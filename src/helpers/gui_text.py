@@ -1,9 +1,11 @@
 import tkinter as tk
 from PIL import Image, ImageDraw, ImageFont, ImageTk
 
+from src.helpers.stats import SharedStats, StatsRate, format_stats
+
 
 class TransparentWindow:
-    def __init__(self):
+    def __init__(self, font_size=30):
         # Создаём корень окна
         self.root = tk.Tk()
         self.root.overrideredirect(True)  # Убираем заголовок окна
@@ -15,16 +17,22 @@ class TransparentWindow:
         # Переменные для хранения изображения и метки
         self.label = None
         self.tk_image = None
+        self.text = None
+
+        # Шрифт загружается один раз, а не при каждом обновлении текста
+        try:
+            self.font = ImageFont.truetype("arial.ttf", font_size)  # Используй путь к шрифту, если требуется
+        except OSError:
+            self.font = ImageFont.load_default()
 
         # Добавляем возможность перемещения окна
         self.root.bind('<Button-1>', self.click_window)
         self.root.bind('<B1-Motion>', self.drag_window)
 
-    def create_transparent_text_image(self, text, size=30, text_color=(0, 0, 0, 255), image_size=(500, 200)):
+    def create_transparent_text_image(self, text, text_color=(0, 0, 0, 255), image_size=(500, 200)):
         """
         Создаёт изображение с полупрозрачным текстом на полностью прозрачном фоне.
         :param text: Текст для отображения.
-        :param size: Размер шрифта.
         :param text_color: Цвет текста (с альфа-каналом для прозрачности).
         :param image_size: Размер изображения (ширина, высота).
         :return: Изображение с текстом.
@@ -33,8 +41,7 @@ class TransparentWindow:
         image = Image.new("RGBA", image_size, (255, 240, 240, 0))  # Прозрачный фон
         draw = ImageDraw.Draw(image)
 
-        # Использование шрифта
-        font = ImageFont.truetype("arial.ttf", size)  # Используй путь к шрифту, если требуется
+        font = self.font
 
         # Вычисление размеров текста
         bbox = draw.textbbox((0, 0), text, font=font)  # Получаем bounding box текста
@@ -53,6 +60,11 @@ class TransparentWindow:
         Обновляет текст в существующем окне.
         :param text: Новый текст для отображения.
         """
+        # Тот же текст — картинку не перерисовываем
+        if text == self.text:
+            return
+        self.text = text
+
         # Создаём новое изображение с обновлённым текстом
         image = self.create_transparent_text_image(text, text_color=(0, 0, 0, 255))  # Чёрный цвет
 
@@ -85,15 +97,19 @@ class TransparentWindow:
 
 
 # Функция для обновления текста в фоновом процессе
-def display_image_with_text(queue):
+def display_image_with_text(stats_name, interval_ms=500):
+    """
+    Окно со статистикой окружения: читает блок SharedStats по имени раз в interval_ms,
+    так что частота перерисовки не зависит от частоты шагов.
+    """
     window = TransparentWindow()  # Создаём объект окна
+    stats = SharedStats(stats_name)
+    rate = StatsRate()
 
-    # Проверяем очередь на наличие обновлений текста
-    def check_queue():
-        if not queue.empty():
-            text = queue.get()  # Получаем текст из очереди
-            window.update_text(text)  # Обновляем текст
-        window.root.after(100, check_queue)  # Проверяем очередь каждые 100 мс
+    def check_stats():
+        snapshot = stats.read()
+        window.update_text(format_stats(snapshot, rate.update(snapshot["steps"])))
+        window.root.after(interval_ms, check_stats)
 
-    check_queue()  # Начинаем проверку очереди
+    check_stats()  # Начинаем опрос счётчиков
     window.start()  # Запуск Tkinter цикла
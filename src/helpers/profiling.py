@@ -0,0 +1,117 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Логарифмическая гистограмма длительностей: 20 корзин на декаду от 100 нс до 100 с,
+# память на фазу постоянная, а перцентили точны до ~12%
+_BUCKETS_PER_DECADE = 20
+_MIN_NS = 100
+_BUCKET_COUNT = 9 * _BUCKETS_PER_DECADE + 1
+_BUCKET_UPPER_NS = _MIN_NS * 10 ** (np.arange(1, _BUCKET_COUNT + 1) / _BUCKETS_PER_DECADE)
+
+
+class _NullPhase:
+    """Контекст выключенного таймера: ничего не замеряет"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class PhaseTimer:
+    """
+    Замеры фаз горячего пути (клик, чтение страницы, наблюдение, награда, инференс агента).
+    Для каждой фазы копится гистограмма длительностей, из которой считаются p50/p95/p99;
+    по желанию последние trace_events отрезков сохраняются для Chrome trace (chrome://tracing, Perfetto).
+    Выключенный таймер отдаёт общий пустой контекст — цена фазы сводится к одному вызову метода.
+    """
+
+    def __init__(self, enabled=False, trace_events=0):
+        """
+        :param enabled: вести замеры.
+        :param trace_events: сколько последних отрезков хранить для Chrome trace; 0 — не хранить.
+        """
+        self.enabled = enabled
+        self.histograms = {}
+        self.totals = {}
+        self.events = deque(maxlen=trace_events) if trace_events else None
+
+    def phase(self, name):
+        """Контекстный менеджер замера: with timer.phase("click"): ..."""
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def record(self, name, start_ns, end_ns):
+        duration = end_ns - start_ns
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = [0] * _BUCKET_COUNT
+            self.totals[name] = [0, 0]
+        # Без NumPy: на горячем пути скалярные вызовы NumPy дороже самого замера
+        bucket = int(math.log10(duration / _MIN_NS) * _BUCKETS_PER_DECADE) if duration > _MIN_NS else 0
+        histogram[min(bucket, _BUCKET_COUNT - 1)] += 1
+        total = self.totals[name]
+        total[0] += 1
+        total[1] += duration
+        if self.events is not None:
+            self.events.append((name, start_ns, duration, threading.get_ident()))
+
+    def reset(self):
+        self.histograms.clear()
+        self.totals.clear()
+        if self.events is not None:
+            self.events.clear()
+
+    def summary(self):
+        """Сводка по фазам в миллисекундах: число замеров, среднее, сумма и перцентили"""
+        result = {}
+        for name, histogram in self.histograms.items():
+            count, total_ns = self.totals[name]
+            cumulative = np.cumsum(histogram)
+            phase = {"count": count, "total_ms": total_ns / 1e6, "mean_ms": total_ns / count / 1e6}
+            for q in (50, 95, 99):
+                bucket = int(np.searchsorted(cumulative, count * q / 100))
+                phase[f"p{q}_ms"] = float(_BUCKET_UPPER_NS[bucket]) / 1e6
+            result[name] = phase
+        return result
+
+    def dump_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def dump_chrome_trace(self, path):
+        """Сохранённые отрезки в формате Chrome trace (complete events, время в микросекундах)"""
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "ts": start / 1000, "dur": duration / 1000, "pid": pid, "tid": tid}
+                  for name, start, duration, tid in (self.events or ())]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
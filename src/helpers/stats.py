@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Счётчики окружения в блоке разделяемой памяти; нулевой слот — номер версии для чтения без блокировок
+STATS_FIELDS = ("wins", "loses", "last_reward", "max_reward", "steps", "episodes")
+
+
+class SharedStats:
+    """
+    Блок float64-счётчиков в разделяемой памяти.
+    Пишет один процесс (окружение) — без блокировок и без pickle: версия в нулевом слоте нечётная,
+    пока идёт запись (seqlock), и читатель повторяет чтение, если попал на запись.
+    Читатели (окно, экспортёр) подключаются по имени и опрашивают блок со своей частотой.
+    """
+
+    def __init__(self, name=None):
+        """:param name: имя существующего блока; без него создаётся новый."""
+        size = (len(STATS_FIELDS) + 1) * np.dtype(np.float64).itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.values = np.ndarray((len(STATS_FIELDS) + 1,), dtype=np.float64, buffer=self.shm.buf)
+        if self.owner:
+            self.values[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def record(self, wins, loses, reward, max_reward, steps, episodes):
+        values = self.values
+        values[0] += 1
+        values[1:] = (wins, loses, reward, max_reward, steps, episodes)
+        values[0] += 1
+
+    def read(self):
+        """Согласованный снимок счётчиков в виде словаря"""
+        values = self.values
+        while True:
+            version = values[0]
+            snapshot = values[1:].copy()
+            if version % 2 == 0 and values[0] == version:
+                return dict(zip(STATS_FIELDS, snapshot.tolist()))
+
+    def close(self):
+        # Ссылки на буфер должны быть освобождены до закрытия отображения
+        self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class StatsRate:
+    """Шаги в секунду по разнице счётчика steps между двумя чтениями"""
+
+    def __init__(self):
+        self.last_steps = None
+        self.last_time = None
+
+    def update(self, steps):
+        now = time.monotonic()
+        rate = 0.0
+        if self.last_steps is not None and now > self.last_time:
+            rate = (steps - self.last_steps) / (now - self.last_time)
+        self.last_steps, self.last_time = steps, now
+        return rate
+
+
+def format_stats(stats, steps_per_sec):
+    return (f"Wins: {int(stats['wins'])} | Loses: {int(stats['loses'])}\n"
+            f"Last reward: {stats['last_reward']:g}\n"
+            f"Max reward: {stats['max_reward']:g}\n"
+            f"Steps/sec: {steps_per_sec:.1f}")
+
+
+def export_stats(name, path, interval=1.0):
+    """
+    Headless-экспортёр для фонового процесса: раз в interval секунд атомарно переписывает JSON-файл
+    со счётчиками и скоростью, чтобы за обучением можно было следить без окна.
+    """
+    stats = SharedStats(name)
+    rate = StatsRate()
+    while True:
+        snapshot = stats.read()
+        snapshot["steps_per_sec"] = rate.update(snapshot["steps"])
+        snapshot["time"] = time.time()
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+        time.sleep(interval)
@@ -0,0 +1,74 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from src.learning.evaluate import wilson_interval
+from src.learning.ppo_env.sweeper_env_ppo import BACKENDS, MinesweeperEnv
+
+
+def choose_cell(observation, action_masks):
+    """Закрытая клетка с наименьшей вероятностью мины"""
+    probabilities = observation['mine_probability'].astype(np.float32).ravel()
+    return int(np.argmin(np.where(action_masks, probabilities, np.inf)))
+
+
+def play(games=1000, seed=0, backend="engine", height=8, width=8, mines=10, board_bank=None, record_path=None,
+         record_compress=False):
+    """
+    Бейзлайн без обучения: решатель открывает выводимо безопасные клетки, остальное — клик по
+    клетке с наименьшей вероятностью мины. Доски те же, что у evaluate при тех же seed и board_bank.
+    :param record_path: каталог для записи партий (например, для обучения с учителем на ходах решателя).
+    """
+    env = MinesweeperEnv(backend=backend, headless=True, show_overlay=False, height=height, width=width,
+                         mines=mines, board_bank=board_bank, auto_resolve=True, mine_probabilities=True,
+                         record_path=record_path, record_compress=record_compress)
+    wins, clicks, decisions = 0, [], 0
+    start = time.perf_counter()
+    try:
+        for game_seed in range(seed, seed + games):
+            options = {"board_index": game_seed} if env.board_bank is not None else None
+            observation, _ = env.reset(seed=game_seed, options=options)
+            terminated = False
+            while not terminated:
+                observation, _, terminated, _, _ = env.step(choose_cell(observation, env.action_masks()))
+                decisions += 1
+            wins += env.game_state == "win"
+            clicks.append(env.steps_counter)
+    finally:
+        env.close()
+    wall_time = time.perf_counter() - start
+    low, high = wilson_interval(wins, games)
+    return {
+        "games": games,
+        "seed": seed,
+        "board_bank": board_bank,
+        "win_rate": wins / games,
+        "win_rate_ci95": [low, high],
+        "mean_clicks": float(np.mean(clicks)),
+        "mean_decisions": decisions / games,
+        "games_per_sec": games / wall_time,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play seeded games with the mine-probability baseline.")
+    parser.add_argument('--games', type=int, default=1000, help="Number of games to play.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first game; game i uses seed + i.")
+    parser.add_argument('--backend', type=str, choices=BACKENDS, default="engine", help="Game backend.")
+    parser.add_argument('--height', type=int, default=8, help="Board height.")
+    parser.add_argument('--width', type=int, default=8, help="Board width.")
+    parser.add_argument('--mines', type=int, default=10, help="Mine count.")
+    parser.add_argument('--board_bank', type=str, default=None, help="Board bank .npz to play from; overrides the board size.")
+    parser.add_argument('--output', type=str, default=None, help="Write the report as JSON to this file.")
+    parser.add_argument('--record_path', type=str, default=None, help="Record the games as trajectory files in this directory.")
+    parser.add_argument('--record_compress', action='store_true', help="Compress recorded trajectory chunks with zlib.")
+    args = parser.parse_args()
+
+    report = play(args.games, args.seed, args.backend, args.height, args.width, args.mines, args.board_bank,
+                  args.record_path, args.record_compress)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
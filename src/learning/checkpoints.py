@@ -0,0 +1,215 @@
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.save_util import save_to_zip_file
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "latest.json"
+
+
+def snapshot(model):
+    """
+    Копия всего, что пишет model.save, снятая в памяти: то же, что BaseAlgorithm.save, но без записи.
+    Занимает единицы миллисекунд, дальше обучение может менять веса и буферы.
+    """
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for name in state_dicts_names + torch_variable_names:
+        exclude.add(name.split(".")[0])
+    for name in exclude:
+        data.pop(name, None)
+    pytorch_variables = {name: copy.deepcopy(_recursive_getattr(model, name)) for name in torch_variable_names}
+    return copy.deepcopy(data), copy.deepcopy(model.get_parameters()), pytorch_variables
+
+
+def _recursive_getattr(obj, name):
+    for part in name.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def read_manifest(checkpoint_dir):
+    path = os.path.join(checkpoint_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_atomic(path, write):
+    """Запись во временный файл и os.replace: читатель видит либо старый, либо новый файл целиком"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CheckpointManager:
+    """
+    Чекпоинты без остановки обучения: снимок модели делается в памяти, а сериализация в zip,
+    запись на диск и ротация — в фоновом потоке.
+    Хранятся последние keep_last файлов и лучший по оценке; манифест latest.json обновляется атомарно,
+    так что последний чекпоинт находится без обхода каталога.
+    """
+
+    def __init__(self, checkpoint_dir, prefix, keep_last=5, score_fn=None):
+        """
+        :param score_fn: оценка записанного чекпоинта по пути (например, винрейт из evaluate). Считается
+                         в отдельном процессе (spawn): запись и обучение её не ждут, а пул процессов оценки
+                         не форкается из многопоточного процесса с torch. Должна передаваться через pickle
+                         (функция модуля или partial). Без неё лучший выбирается по переданному score.
+        """
+        if keep_last < 1:
+            # Последний чекпоинт нужен для продолжения обучения
+            raise ValueError(f"keep_last must be at least 1, got {keep_last}")
+        self.checkpoint_dir = checkpoint_dir
+        self.prefix = prefix
+        self.keep_last = keep_last
+        self.score_fn = score_fn
+        self.scorer = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) \
+            if score_fn is not None else None
+        # Чекпоинты, оценка которых ещё идёт: имя -> Future; до оценки они не удаляются ротацией
+        self.pending_scores = {}
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.manifest = read_manifest(checkpoint_dir) or {"latest": None, "timesteps": 0, "checkpoints": [],
+                                                          "best": None}
+        # Не больше двух снимков в очереди: если диск не успевает, обучение подождёт, а память не растёт
+        self.queue = queue.Queue(maxsize=2)
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    def save(self, model, score=None):
+        """Снимок модели и постановка записи в очередь; возвращается сразу"""
+        self.queue.put((snapshot(model), model.num_timesteps, score))
+
+    def flush(self):
+        """Ожидание записи всех поставленных чекпоинтов"""
+        self.queue.join()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.scorer is not None:
+            # Дожидаемся оценок, чтобы лучший чекпоинт в манифесте был окончательным
+            for future in list(self.pending_scores.values()):
+                future.exception()
+            self.scorer.shutdown()
+            self._apply_scores()
+            self._rotate(self.manifest["checkpoints"])
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                logger.error(f"Failed to write checkpoint: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, model_snapshot, timesteps, score):
+        data, params, pytorch_variables = model_snapshot
+        name = f"{self.prefix}_{timesteps}_steps.zip"
+        path = os.path.join(self.checkpoint_dir, name)
+        _write_atomic(path, lambda f: save_to_zip_file(f, data=data, params=params,
+                                                       pytorch_variables=pytorch_variables))
+        self._apply_scores()
+        if self.scorer is not None:
+            self.pending_scores[name] = self.scorer.submit(self.score_fn, path)
+        else:
+            self._update_best(name, score)
+        self.manifest["latest"] = name
+        self.manifest["timesteps"] = int(timesteps)
+        self._rotate([checkpoint for checkpoint in self.manifest["checkpoints"] if checkpoint != name] + [name])
+
+    def _apply_scores(self):
+        """Учёт оценок, посчитанных к этому моменту"""
+        for name, future in list(self.pending_scores.items()):
+            if not future.done():
+                continue
+            del self.pending_scores[name]
+            if future.exception() is not None:
+                logger.error(f"Failed to score checkpoint {name}: {future.exception()}")
+            else:
+                self._update_best(name, future.result())
+
+    def _update_best(self, name, score):
+        best = self.manifest["best"]
+        if score is not None and (best is None or score > best["score"]):
+            self.manifest["best"] = {"path": name, "score": float(score)}
+            logger.warning(f"New best checkpoint {name} with score {score:.4f}")
+
+    def _rotate(self, checkpoints):
+        """Удаление всего, кроме последних keep_last, лучшего и ещё не оценённых; запись манифеста"""
+        best = self.manifest["best"]
+        protected = set(self.pending_scores)
+        if best is not None:
+            protected.add(best["path"])
+        split = max(len(checkpoints) - self.keep_last, 0)
+        kept = []
+        for old in checkpoints[:split]:
+            if old in protected:
+                # Порядок сохраняется: при следующей ротации первым удаляется самый старый
+                kept.append(old)
+                continue
+            try:
+                os.remove(os.path.join(self.checkpoint_dir, old))
+            except FileNotFoundError:
+                pass
+        self.manifest["checkpoints"] = kept + checkpoints[split:]
+        manifest = json.dumps(self.manifest, indent=2).encode()
+        _write_atomic(os.path.join(self.checkpoint_dir, MANIFEST_NAME), lambda f: f.write(manifest))
+
+
+class AsyncCheckpointCallback(BaseCallback):
+    """Замена CheckpointCallback: каждые save_freq вызовов отдаёт модель в CheckpointManager"""
+
+    def __init__(self, manager, save_freq, verbose=0):
+        super(AsyncCheckpointCallback, self).__init__(verbose)
+        self.manager = manager
+        self.save_freq = save_freq
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq == 0:
+            # Без score_fn лучший чекпоинт — по средней награде последних эпизодов
+            rewards = [info["r"] for info in self.model.ep_info_buffer]
+            self.manager.save(self.model, score=float(np.mean(rewards)) if rewards else None)
+        return True
+
+
+class SaveProgressCallback(BaseCallback):
+    n_calls: int = 0
+
+    def __init__(self, save_path, save_freq=100000, verbose=0):
+        super(SaveProgressCallback, self).__init__(verbose)
+        self.save_path = save_path
+        self.save_freq = save_freq
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.save_freq == 0:
+            if os.path.exists(self.save_path):
+                with open(self.save_path, "r") as f:
+                    data = json.load(f)
+                current_timesteps = data.get("timesteps", 0)
+            else:
+                current_timesteps = 0
+            current_timesteps += self.save_freq * self.training_env.num_envs
+            with open(self.save_path, "w") as f:
+                json.dump({"timesteps": current_timesteps}, f)
+
+        return True
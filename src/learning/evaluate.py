@@ -0,0 +1,219 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from constants import PPO_CHECKPOINT_DIR
+from src.learning.ppo_env.factory import EnvFactory
+from src.learning.ppo_env.observations import OBSERVATION_MODES, field_space
+from src.minesweeper_engine import BoardBank
+
+# Модель и окружение живут в глобальных переменных процесса-воркера: грузятся один раз в initializer
+_worker = {}
+
+
+def wilson_interval(successes, total, z=1.96):
+    """95% доверительный интервал Уилсона для доли побед"""
+    if total == 0:
+        return 0.0, 0.0
+    p = successes / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def load_model(checkpoint, maskable):
+    if maskable:
+        from sb3_contrib import MaskablePPO
+        return MaskablePPO.load(checkpoint, device="cpu")
+    from stable_baselines3 import PPO
+    return PPO.load(checkpoint, device="cpu")
+
+
+def detect_observation_mode(model):
+    """Режим наблюдений, под который обучен чекпоинт (по observation_space модели или InferenceHandle)"""
+    space = model.observation_space.spaces['field_state']
+    height, width = space.shape[-2:]
+    for mode in OBSERVATION_MODES:
+        if field_space(mode, height, width) == space:
+            return mode
+    raise ValueError(f"Checkpoint field_state space {space} does not match any observation mode")
+
+
+def _init_worker(checkpoint, maskable, mines, board_bank, height, width, server=None, auto_resolve=False):
+    import torch
+
+    # Процессов столько же, сколько ядер: потоки torch внутри каждого только мешают друг другу
+    torch.set_num_threads(1)
+    _worker["maskable"] = maskable
+    if server is not None:
+        # Модель живёт в процессе сервера, воркеру нужно только подключиться к своему слоту
+        _worker["client"] = server.connect()
+        trained = server
+    else:
+        trained = _worker["model"] = load_model(checkpoint, maskable)
+    trained_height, trained_width = trained.observation_space.spaces['field_state'].shape[-2:]
+    env = EnvFactory("engine", observation_mode=detect_observation_mode(trained),
+                     height=height or trained_height, width=width or trained_width, mines=mines,
+                     board_bank=board_bank, auto_resolve=auto_resolve,
+                     mine_probabilities='mine_probability' in trained.observation_space.spaces)()
+    if (env.frame_height, env.frame_width) != (trained_height, trained_width):
+        # Свёрточная политика играет на поле любого размера: те же веса в модели под новое пространство
+        from src.learning.ppo_env.conv_policy import resize_model
+        _worker["model"] = resize_model(_worker["model"], env)
+    _worker["env"] = env
+
+
+def _play_games(seeds, max_steps, deterministic):
+    """Партии на досках из seeds; возвращает сырые замеры для общего отчёта"""
+    model = _worker.get("model")
+    client = _worker.get("client")
+    env = _worker["env"]
+    # Без маски политика может бесконечно кликать по открытой клетке — партия обрезается
+    max_steps = max_steps or env.frame_height * env.frame_width * 4
+    results = {"wins": 0, "games": 0, "truncated": 0, "clicks": [], "env_time": 0.0, "env_steps": 0,
+               "inference": []}
+    for seed in seeds:
+        # Доска определяется сидом партии, а с банком досок — её номером
+        options = {"board_index": seed} if env.board_bank is not None else None
+        start = time.perf_counter()
+        observation, _ = env.reset(seed=seed, options=options)
+        results["env_time"] += time.perf_counter() - start
+        terminated = False
+        for _ in range(max_steps):
+            start = time.perf_counter()
+            if client is not None:
+                # Детерминированность задаётся на сервере
+                action = client.predict(observation, env.action_masks())
+            elif _worker["maskable"]:
+                action, _ = model.predict(observation, deterministic=deterministic, action_masks=env.action_masks())
+            else:
+                action, _ = model.predict(observation, deterministic=deterministic)
+            results["inference"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            observation, _, terminated, _, _ = env.step(action)
+            results["env_time"] += time.perf_counter() - start
+            results["env_steps"] += 1
+            if terminated:
+                break
+        results["games"] += 1
+        results["wins"] += terminated and env.game_state == "win"
+        results["truncated"] += not terminated
+        results["clicks"].append(env.steps_counter)
+    return results
+
+
+def evaluate(checkpoint, games=1000, workers=None, seed=0, maskable=False, deterministic=True, max_steps=None,
+             mines=10, board_bank=None, height=None, width=None, inference_server=False, max_latency_ms=2.0,
+             torchscript=False, reload_dir=None, auto_resolve=False):
+    """
+    Оценка чекпоинта на games сидированных партиях в пуле процессов с headless-движком.
+    :param board_bank: путь к банку досок; партии играются на досках seed..seed+games-1 из него.
+    :param height, width: размер поля, если он отличается от того, на котором обучен чекпоинт (свёрточная политика).
+    :param inference_server: считать действия всех воркеров пакетами в одном InferenceServer
+                             (max_latency_ms и torchscript — его параметры), а не model.predict в каждом воркере.
+    :param reload_dir: каталог чекпоинтов, из которого сервер подхватывает новый последний чекпоинт во время игры
+                       (долгие прогоны параллельно с обучением); винрейт тогда относится к смеси чекпоинтов.
+    :param auto_resolve: играть по тем же правилам, что и при обучении с auto_resolve: выводимо безопасные
+                         клетки открываются сами.
+    :return: словарь с винрейтом, доверительным интервалом, кликами и метриками скорости.
+    """
+    workers = workers or os.cpu_count()
+    seeds = np.arange(seed, seed + games)
+    chunks = [chunk.tolist() for chunk in np.array_split(seeds, workers * 4) if len(chunk)]
+
+    server = None
+    if inference_server:
+        if height or width:
+            raise ValueError("The inference server plays on the board size the checkpoint was trained on")
+        from src.learning.inference_server import InferenceServer
+        server = InferenceServer(checkpoint, maskable, slots=workers, deterministic=deterministic,
+                                 max_latency_ms=max_latency_ms, torchscript=torchscript,
+                                 reload_dir=reload_dir)
+        if board_bank:
+            bank = BoardBank.load(board_bank)
+            trained_shape = server.observation_space.spaces['field_state'].shape[-2:]
+            if (bank.height, bank.width) != tuple(trained_shape):
+                server.close()
+                raise ValueError(f"The inference server plays on the board size the checkpoint was trained on "
+                                 f"({trained_shape[0]}x{trained_shape[1]}), the board bank has "
+                                 f"{bank.height}x{bank.width} boards")
+        server.start()
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(checkpoint, maskable, mines, board_bank, height, width,
+                                           server.handle if server else None, auto_resolve)) as pool:
+            parts = list(pool.map(_play_games, chunks, [max_steps] * len(chunks), [deterministic] * len(chunks)))
+    finally:
+        if server is not None:
+            server.close()
+    wall_time = time.perf_counter() - start
+
+    wins = sum(part["wins"] for part in parts)
+    total = sum(part["games"] for part in parts)
+    clicks = np.concatenate([part["clicks"] for part in parts])
+    inference_ms = np.concatenate([part["inference"] for part in parts]) * 1000
+    env_time = sum(part["env_time"] for part in parts)
+    env_steps = sum(part["env_steps"] for part in parts)
+    low, high = wilson_interval(wins, total)
+    return {
+        "checkpoint": checkpoint,
+        "games": total,
+        "seed": seed,
+        "board_bank": board_bank,
+        "win_rate": wins / total,
+        "win_rate_ci95": [low, high],
+        "truncated_games": sum(part["truncated"] for part in parts),
+        "mean_clicks": float(clicks.mean()),
+        "env_steps_per_sec": env_steps / env_time if env_time else 0.0,
+        "inference_ms": {f"p{q}": float(np.percentile(inference_ms, q)) for q in (50, 95, 99)},
+        "games_per_sec": total / wall_time,
+        "workers": workers,
+    }
+
+
+if __name__ == "__main__":
+    from src.learning.start_learning import find_latest_checkpoint
+
+    parser = argparse.ArgumentParser(description="Evaluate a PPO checkpoint on seeded headless games.")
+    parser.add_argument('--checkpoint', type=str, default=None, help="Checkpoint zip; defaults to the latest one in PPO_CHECKPOINT_DIR.")
+    parser.add_argument('--games', type=int, default=1000, help="Number of games to play.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the first game; game i uses seed + i.")
+    parser.add_argument('--maskable', action='store_true', help="The checkpoint is a MaskablePPO model.")
+    parser.add_argument('--stochastic', action='store_true', help="Sample actions instead of taking the most likely one.")
+    parser.add_argument('--mines', type=int, default=10, help="Mine count; the board size comes from the checkpoint unless --height/--width are given.")
+    parser.add_argument('--height', type=int, default=None, help="Board height for a convolutional policy played on another board size.")
+    parser.add_argument('--width', type=int, default=None, help="Board width for a convolutional policy played on another board size.")
+    parser.add_argument('--board_bank', type=str, default=None, help="Board bank .npz to play from; generated from --seed if the file does not exist.")
+    parser.add_argument('--inference_server', action='store_true', help="Batch the policy forward passes of all workers in one inference server process.")
+    parser.add_argument('--max_latency_ms', type=float, default=2.0, help="How long the inference server lets the first request of a batch wait for more.")
+    parser.add_argument('--torchscript', action='store_true', help="Run the inference server on a traced TorchScript policy.")
+    parser.add_argument('--reload_dir', type=str, default=None, help="Let the inference server hot-reload the newest checkpoint from this directory while games are played.")
+    parser.add_argument('--auto_resolve', action='store_true', help="Open deducibly safe cells automatically after every move, as in training with --auto_resolve.")
+    parser.add_argument('--output', type=str, default=None, help="Write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or find_latest_checkpoint(PPO_CHECKPOINT_DIR, "PPO")
+    if checkpoint is None:
+        parser.error(f"No checkpoint found in {PPO_CHECKPOINT_DIR}")
+    if args.board_bank and not os.path.exists(args.board_bank):
+        height, width = load_model(checkpoint, args.maskable).observation_space.spaces['field_state'].shape[-2:]
+        BoardBank.generate(args.seed + args.games, args.height or height, args.width or width, args.mines,
+                           args.seed).save(args.board_bank)
+    report = evaluate(checkpoint, args.games, args.workers, args.seed, args.maskable, not args.stochastic,
+                      mines=args.mines, board_bank=args.board_bank, height=args.height, width=args.width,
+                      inference_server=args.inference_server, max_latency_ms=args.max_latency_ms,
+                      torchscript=args.torchscript, reload_dir=args.reload_dir, auto_resolve=args.auto_resolve)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,300 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import warnings
+from multiprocessing import shared_memory
+
+import numpy as np
+from gymnasium import spaces
+
+from src.learning.evaluate import load_model
+
+logger = logging.getLogger(__name__)
+
+# Маскированные логиты — как в MaskableCategorical, чтобы действия совпадали с model.predict
+_MASKED_LOGIT = -1e8
+
+
+def _slot_layout(observation_space, n_actions):
+    """Массивы одного слота: ключи наблюдения, маска действий и ответ сервера"""
+    layout = []
+    for key, space in observation_space.spaces.items():
+        if isinstance(space, spaces.Discrete):
+            layout.append((key, (), np.dtype(np.int64)))
+        else:
+            layout.append((key, space.shape, np.dtype(space.dtype)))
+    layout.append(("action_masks", (n_actions,), np.dtype(np.bool_)))
+    layout.append(("actions", (), np.dtype(np.int64)))
+    return layout
+
+
+class _SlotArrays:
+    """Массивы (slots, ...) для каждого элемента layout в одном блоке разделяемой памяти"""
+
+    def __init__(self, layout, slots, name=None):
+        sizes = [slots * int(np.prod(shape, dtype=np.int64)) * dtype.itemsize for _, shape, dtype in layout]
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=max(sum(sizes), 1))
+        self.arrays, offset = {}, 0
+        for (key, shape, dtype), size in zip(layout, sizes):
+            self.arrays[key] = np.ndarray((slots,) + tuple(shape), dtype=dtype, buffer=self.shm.buf, offset=offset)
+            offset += size
+
+    def close(self):
+        self.arrays = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class InferenceHandle:
+    """
+    Всё, что нужно процессу-клиенту для подключения к серверу. Передаётся в процесс при его создании
+    (аргумент Process или initargs пула): очереди и семафоры multiprocessing иначе не передаются.
+    """
+
+    def __init__(self, layout, slots, shm_name, requests, responses, next_slot, observation_space):
+        self.layout = layout
+        self.slots = slots
+        self.shm_name = shm_name
+        self.requests = requests
+        self.responses = responses
+        self.next_slot = next_slot
+        self.observation_space = observation_space
+
+    def connect(self):
+        """Клиент со своим слотом; у каждого процесса-клиента должен быть свой"""
+        with self.next_slot.get_lock():
+            slot = self.next_slot.value
+            if slot >= self.slots:
+                raise RuntimeError(f"All {self.slots} inference server slots are taken")
+            self.next_slot.value += 1
+        return InferenceClient(self, slot)
+
+
+class InferenceClient:
+    """Синхронный predict через сервер: наблюдение пишется в свой слот, номер слота — в очередь запросов"""
+
+    def __init__(self, handle, slot):
+        self.slot = slot
+        self.requests = handle.requests
+        self.response = handle.responses[slot]
+        self.memory = _SlotArrays(handle.layout, handle.slots, name=handle.shm_name)
+        arrays = self.memory.arrays
+        self.observations = {key: arrays[key] for key in handle.observation_space.spaces}
+        self.action_masks = arrays["action_masks"]
+        self.actions = arrays["actions"]
+
+    def predict(self, observation, action_masks=None):
+        """
+        :param action_masks: маска допустимых действий; учитывается, если сервер обслуживает MaskablePPO.
+        :return: действие (int).
+        """
+        slot = self.slot
+        for key, array in self.observations.items():
+            array[slot] = observation[key]
+        self.action_masks[slot] = True if action_masks is None else action_masks
+        self.requests.put(slot)
+        self.response.acquire()
+        return int(self.actions[slot])
+
+    def close(self):
+        self.observations = self.action_masks = self.actions = None
+        self.memory.close()
+
+
+def _policy_logits(policy, keys):
+    """Модуль наблюдение -> логиты действий без критика и распределения; входы — тензоры в порядке keys"""
+    import torch as th
+    from stable_baselines3.common.policies import BaseModel
+
+    class PolicyLogits(th.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.policy = policy
+
+        def forward(self, *observations):
+            features = BaseModel.extract_features(self.policy, dict(zip(keys, observations)),
+                                                  self.policy.pi_features_extractor)
+            return self.policy.action_net(self.policy.mlp_extractor.forward_actor(features))
+
+    return PolicyLogits().eval()
+
+
+class InferenceServer:
+    """
+    Пакетный инференс политики PPO для нескольких процессов с окружениями.
+    Клиенты (InferenceClient) кладут наблюдения в слоты разделяемой памяти; сервер в отдельном процессе
+    собирает запросы в пакет, пока не наберётся max_batch, не ответят все подключённые клиенты
+    или не истечёт max_latency_ms с первого запроса, и считает весь пакет одним вызовом сети
+    под torch.inference_mode (или через TorchScript). Так накладные расходы PyTorch на вызов
+    платятся раз на пакет, а не на каждый шаг каждого окружения.
+    """
+
+    def __init__(self, checkpoint, maskable=False, slots=None, deterministic=True, max_batch=None,
+                 max_latency_ms=2.0, torchscript=False, reload_dir=None, reload_interval=10.0, threads=None,
+                 mp_context=None):
+        """
+        :param slots: сколько клиентов можно подключить (по умолчанию число ядер).
+        :param max_batch: наибольший пакет (по умолчанию slots).
+        :param max_latency_ms: сколько первый запрос пакета может ждать остальных.
+        :param torchscript: считать через torch.jit.trace политики вместо eager-модуля.
+        :param reload_dir: каталог чекпоинтов; раз в reload_interval секунд сервер берёт из него
+                           новый последний чекпоинт, не останавливая обслуживание.
+        :param threads: число потоков torch в процессе сервера.
+        :param mp_context: метод запуска процессов ("fork", "spawn", ...); по умолчанию — метод multiprocessing.
+        """
+        self.checkpoint = checkpoint
+        self.maskable = maskable
+        self.slots = slots or multiprocessing.cpu_count()
+        self.deterministic = deterministic
+        self.max_batch = max_batch or self.slots
+        self.max_latency = max_latency_ms / 1000
+        self.torchscript = torchscript
+        self.reload_dir = reload_dir
+        self.reload_interval = reload_interval
+        self.threads = threads
+        self.context = multiprocessing.get_context(mp_context)
+
+        model = load_model(checkpoint, maskable)
+        self.observation_space = model.observation_space
+        self.layout = _slot_layout(model.observation_space, model.action_space.n)
+        del model
+        self.memory = _SlotArrays(self.layout, self.slots)
+        self.requests = self.context.Queue()
+        self.responses = [self.context.Semaphore(0) for _ in range(self.slots)]
+        self.next_slot = self.context.Value("i", 0)
+        self.process = None
+
+    @property
+    def handle(self):
+        return InferenceHandle(self.layout, self.slots, self.memory.shm.name, self.requests, self.responses,
+                               self.next_slot, self.observation_space)
+
+    def __getstate__(self):
+        # При spawn сервер передаётся в процесс через pickle: массивы поверх разделяемой памяти стали бы
+        # частными копиями, поэтому блок передаётся по имени и подключается заново в _serve
+        state = self.__dict__.copy()
+        state["memory"] = None
+        state["process"] = None
+        state["context"] = None
+        return state
+
+    def start(self):
+        ready = self.context.Event()
+        self.process = self.context.Process(target=self._serve, args=(self.memory.shm.name, ready),
+                                            name="inference-server", daemon=True)
+        self.process.start()
+        ready.wait()
+        return self
+
+    def close(self):
+        if self.process is not None:
+            self.requests.put(None)
+            self.process.join()
+            self.process = None
+        self.memory.close()
+
+    def _load(self, checkpoint):
+        """Функция батч -> действия для чекпоинта"""
+        import torch as th
+
+        policy = load_model(checkpoint, self.maskable).policy
+        policy.set_training_mode(False)
+        keys = list(self.observation_space.spaces)
+        logits_fn = _policy_logits(policy, keys)
+        if self.torchscript:
+            example = [th.as_tensor(self.memory.arrays[key][:1]) for key in keys]
+            with th.no_grad(), warnings.catch_warnings():
+                # torch 2.x помечает jit как устаревший, но трассировка по-прежнему работает
+                warnings.simplefilter("ignore", FutureWarning)
+                logits_fn = th.jit.freeze(th.jit.trace(logits_fn, example, check_trace=False))
+
+        def act(observations, action_masks):
+            with th.inference_mode():
+                logits = logits_fn(*(th.as_tensor(observations[key]) for key in keys))
+                if self.maskable:
+                    logits = th.where(th.as_tensor(action_masks), logits, _MASKED_LOGIT)
+                if self.deterministic:
+                    return logits.argmax(dim=1).numpy()
+                return th.distributions.Categorical(logits=logits).sample().numpy()
+
+        return act
+
+    def _serve(self, shm_name, ready):
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        # И при fork, и при spawn сервер работает с тем же блоком, что и клиенты
+        self.memory = _SlotArrays(self.layout, self.slots, name=shm_name)
+        arrays = self.memory.arrays
+        observations = {key: arrays[key] for key in self.observation_space.spaces}
+        state = {"act": self._load(self.checkpoint), "checkpoint": self.checkpoint, "loading": False}
+        ready.set()
+        last_check = time.monotonic()
+        batches = requests = 0
+        while True:
+            if self.reload_dir and not state["loading"] and time.monotonic() - last_check >= self.reload_interval:
+                last_check = time.monotonic()
+                self._check_reload(state)
+            try:
+                first = self.requests.get(timeout=self.reload_interval if self.reload_dir else None)
+            except queue.Empty:
+                continue
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_latency
+            stop = False
+            # Каждый клиент ждёт ответа на свой запрос, так что больше чем подключённых клиентов не придёт
+            limit = min(self.max_batch, self.next_slot.value)
+            while len(batch) < limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    slot = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if slot is None:
+                    stop = True
+                    break
+                batch.append(slot)
+            index = np.asarray(batch)
+            arrays["actions"][index] = state["act"]({key: array[index] for key, array in observations.items()},
+                                                    arrays["action_masks"][index])
+            for slot in batch:
+                self.responses[slot].release()
+            batches += 1
+            requests += len(batch)
+            if stop:
+                break
+        if batches:
+            logger.info(f"Inference server: {requests} requests in {batches} batches "
+                        f"({requests / batches:.1f} per batch)")
+        observations = arrays = None
+        self.memory.close()
+
+    def _check_reload(self, state):
+        """Новый последний чекпоинт загружается в фоновом потоке, обслуживание идёт на старом"""
+        from src.learning.start_learning import find_latest_checkpoint
+
+        latest = find_latest_checkpoint(self.reload_dir, "PPO")
+        if latest is None or latest == state["checkpoint"]:
+            return
+
+        def load():
+            try:
+                state["act"] = self._load(latest)
+                state["checkpoint"] = latest
+                logger.warning(f"Inference server reloaded {latest}")
+            except Exception as e:
+                # Чекпоинт мог быть ещё не дописан — попробуем при следующей проверке
+                logger.error(f"Failed to reload {latest}: {e}")
+            finally:
+                state["loading"] = False
+
+        state["loading"] = True
+        threading.Thread(target=load, name="inference-reload", daemon=True).start()
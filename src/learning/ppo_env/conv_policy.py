@@ -0,0 +1,137 @@
+from functools import partial
+
+import numpy as np
+import torch as th
+from torch import nn
+from torch.nn import functional as F
+from sb3_contrib.common.maskable.policies import MaskableMultiInputActorCriticPolicy
+from stable_baselines3.common.policies import MultiInputActorCriticPolicy
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+from src.learning.ppo_env.observations import CODE_COUNT, field_space
+
+
+class BoardFeaturesExtractor(BaseFeaturesExtractor):
+    """
+    Свёрточный ствол без полносвязных слоёв: из наблюдения (C, H, W) получается карта признаков
+    (channels, H, W) того же размера. Веса не зависят от размера поля.
+    Вход — компактные коды (разворачиваются в one-hot здесь же) или one-hot плоскости,
+    плюс плоскость mine_probability, если она есть в наблюдении.
+    """
+
+    def __init__(self, observation_space, channels=32, layers=6):
+        """
+        :param channels: число каналов признаков на клетку (features_dim).
+        :param layers: число свёрток 3x3; поле зрения клетки — (2 * layers + 1)^2.
+        """
+        super(BoardFeaturesExtractor, self).__init__(observation_space, features_dim=channels)
+        field = observation_space.spaces['field_state']
+        height, width = field.shape[-2:]
+        if field == field_space("onehot", height, width):
+            self.compact = False
+        elif field == field_space("compact", height, width):
+            self.compact = True
+        else:
+            raise ValueError("The convolutional policy needs the compact or onehot observation mode")
+        self.with_probability = 'mine_probability' in observation_space.spaces
+        in_channels = CODE_COUNT + int(self.with_probability)
+        modules = []
+        for index in range(layers):
+            modules += [nn.Conv2d(in_channels if index == 0 else channels, channels, kernel_size=3, padding=1), nn.ReLU()]
+        self.trunk = nn.Sequential(*modules)
+
+    def forward(self, observations):
+        field = observations['field_state']
+        if self.compact:
+            field = F.one_hot(field.long(), CODE_COUNT).permute(0, 3, 1, 2).float()
+        planes = [field]
+        if self.with_probability:
+            planes.append(observations['mine_probability'].unsqueeze(1))
+        return self.trunk(th.cat(planes, dim=1))
+
+
+class _SharedLatent(nn.Module):
+    """Вместо MLP: карта признаков уходит в обе головы как есть"""
+
+    def forward(self, features):
+        return features, features
+
+    def forward_actor(self, features):
+        return features
+
+    def forward_critic(self, features):
+        return features
+
+
+class CellLogits(nn.Module):
+    """Логит действия для каждой клетки: свёртка 1x1, затем (B, H * W) в порядке индекса действия x * width + y"""
+
+    def __init__(self, channels):
+        super(CellLogits, self).__init__()
+        self.conv = nn.Conv2d(channels, 1, kernel_size=1)
+
+    def forward(self, features):
+        return self.conv(features).flatten(1)
+
+
+class BoardValue(nn.Module):
+    """Оценка состояния по среднему признаку клеток"""
+
+    def __init__(self, channels):
+        super(BoardValue, self).__init__()
+        self.linear = nn.Linear(channels, 1)
+
+    def forward(self, features):
+        return self.linear(features.mean(dim=(2, 3)))
+
+
+class ConvCellPolicyMixin:
+    """
+    Политика для полей любого размера: свёрточный ствол, логит на клетку и среднее по клеткам для критика.
+    Память и вычисления на шаг растут линейно с числом клеток, а веса одной модели подходят к любому полю
+    (см. transfer_policy).
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("features_extractor_class", BoardFeaturesExtractor)
+        kwargs["share_features_extractor"] = True
+        super().__init__(*args, **kwargs)
+
+    def _build_mlp_extractor(self) -> None:
+        self.mlp_extractor = _SharedLatent()
+
+    def _build(self, lr_schedule) -> None:
+        self._build_mlp_extractor()
+        self.action_net = CellLogits(self.features_dim)
+        self.value_net = BoardValue(self.features_dim)
+        if self.ortho_init:
+            module_gains = {self.features_extractor: np.sqrt(2), self.action_net: 0.01, self.value_net: 1}
+            for module, gain in module_gains.items():
+                module.apply(partial(self.init_weights, gain=gain))
+        self.optimizer = self.optimizer_class(self.parameters(), lr=lr_schedule(1), **self.optimizer_kwargs)
+
+
+class ConvCellPolicy(ConvCellPolicyMixin, MultiInputActorCriticPolicy):
+    pass
+
+
+class MaskableConvCellPolicy(ConvCellPolicyMixin, MaskableMultiInputActorCriticPolicy):
+    pass
+
+
+def transfer_policy(model, checkpoint):
+    """
+    Загрузка весов свёрточной политики из чекпоинта, обученного на поле другого размера.
+    Пространства наблюдений не совпадают, поэтому model.load не подходит: берутся только веса сети.
+    :param model: новая модель того же класса с нужным окружением.
+    """
+    trained = type(model).load(checkpoint, device=model.device)
+    model.policy.load_state_dict(trained.policy.state_dict())
+    return model
+
+
+def resize_model(model, env):
+    """Копия обученной свёрточной модели для окружения с другим размером поля (для инференса и оценки)"""
+    resized = type(model)(type(model.policy), env, policy_kwargs=model.policy_kwargs, device=model.device)
+    resized.policy.load_state_dict(model.policy.state_dict())
+    return resized
@@ -0,0 +1,22 @@
+class EnvFactory:
+    """
+    Лёгкий конструктор MinesweeperEnv для воркеров и точек входа: хранит только параметры, дёшево
+    передаётся в другие процессы, а модуль окружения импортирует при вызове — в том процессе, где
+    окружение строится. Headless-воркеру с движком достаются только NumPy и gymnasium:
+    Playwright подгружается лишь для браузерного бэкенда, Tk и PIL — лишь с окном статистики.
+    """
+
+    def __init__(self, backend="engine", **env_kwargs):
+        """
+        :param env_kwargs: параметры MinesweeperEnv; по умолчанию без окна браузера и без окна статистики.
+        """
+        env_kwargs.setdefault("headless", True)
+        env_kwargs.setdefault("show_overlay", False)
+        self.backend = backend
+        self.env_kwargs = env_kwargs
+
+    def __call__(self, **overrides):
+        """Новое окружение; overrides перекрывают сохранённые параметры (например, свой record_path у воркера)"""
+        from src.learning.ppo_env.sweeper_env_ppo import MinesweeperEnv
+
+        return MinesweeperEnv(backend=self.backend, **{**self.env_kwargs, **overrides})
@@ -0,0 +1,47 @@
+import numpy as np
+from gymnasium import spaces
+
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL, MINE_CELL
+
+# raw — коды контроллера как есть (99, -77, -1, 0..8) в int8, как их отдаёт страница;
+# compact — плотный int8-код на клетку; onehot — стек плоскостей (C, H, W) uint8 по компактным кодам
+OBSERVATION_MODES = ("raw", "compact", "onehot")
+
+# Компактные коды: 0..8 — открытая клетка с числом
+CODE_CLOSED = 9
+CODE_FLAG = 10
+CODE_MINE = 11
+CODE_COUNT = 12
+
+# Таблица raw -> compact, индексируется байтом raw-кода (uint8-представление int8)
+_RAW_TO_COMPACT = np.full(256, CODE_MINE, dtype=np.int8)
+_RAW_TO_COMPACT[:9] = np.arange(9)
+_RAW_TO_COMPACT[CLOSED_CELL & 0xFF] = CODE_CLOSED
+_RAW_TO_COMPACT[FLAG_CELL & 0xFF] = CODE_FLAG
+_RAW_TO_COMPACT[MINE_CELL & 0xFF] = CODE_MINE
+
+_ONEHOT = np.eye(CODE_COUNT, dtype=np.uint8)
+
+
+def field_space(mode, height, width):
+    """Пространство для field_state в выбранном режиме"""
+    if mode == "raw":
+        return spaces.Box(low=MINE_CELL, high=CLOSED_CELL, shape=(height, width), dtype=np.int8)
+    if mode == "compact":
+        return spaces.Box(low=0, high=CODE_COUNT - 1, shape=(height, width), dtype=np.int8)
+    if mode == "onehot":
+        return spaces.Box(low=0, high=1, shape=(CODE_COUNT, height, width), dtype=np.uint8)
+    raise ValueError(f"Unknown observation mode: {mode}, expected one of {OBSERVATION_MODES}")
+
+
+def encode_field(field, mode):
+    """
+    Перевод поля из кодов контроллера в выбранный режим.
+    Работает и для одной доски (H, W), и для пакета (N, H, W); onehot добавляет ось каналов перед (H, W).
+    """
+    if mode == "raw":
+        return np.asarray(field, dtype=np.int8)
+    codes = _RAW_TO_COMPACT[np.asarray(field).astype(np.uint8)]
+    if mode == "compact":
+        return codes
+    return np.moveaxis(_ONEHOT[codes], -1, -3)
@@ -1,33 +1,69 @@
 import logging
+import os
 import time
 import multiprocessing
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
 
-from src.helpers.gui_text import display_image_with_text
-from src.minesweeper_controller import MinesweeperBotWeb
-
-logging.basicConfig(
-    level=logging.WARN,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler("../main.log"),  # Логирование в файл
-        logging.StreamHandler()  # Логирование в консоль
-    ]
-)
+from src.helpers.profiling import PhaseTimer
+from src.helpers.stats import SharedStats, export_stats
+from src.learning.ppo_env.observations import encode_field, field_space
+from src.learning.trajectories import TrajectoryRecorder
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL, MINE_CELL, BoardBank, MinesweeperEngine, generate_board
+from src.minesweeper_probability import MineProbabilityEngine
+from src.minesweeper_solver import find_forced_moves
 
 logger = logging.getLogger(__name__)
 
 
+# browser — настоящий winmine.html через Playwright, engine — headless-движок на NumPy
+BACKENDS = ("browser", "engine")
+
+
 class MinesweeperEnv(gym.Env):
-    def __init__(self):
+    def __init__(self, backend="browser", headless=False, cdp_endpoint=None, show_overlay=True,
+                 observation_mode="raw", height=8, width=8, mines=10, board_bank=None, auto_resolve=False,
+                 mine_probabilities=False, stats_path=None, profile=False, trace_events=0,
+                 record_path=None, record_compress=False):
+        """
+        :param board_bank: BoardBank или путь к .npz с заранее сгенерированными досками;
+                           reset(options={"board_index": i}) играет i-ю доску, иначе доска выбирается по сиду.
+        :param auto_resolve: после хода агента открывать все клетки, безопасность которых выводится
+                             решателем, так что агент принимает только неочевидные решения.
+        :param mine_probabilities: добавить в наблюдение плоскость mine_probability (float16) с вероятностями мин.
+        :param show_overlay: окно со статистикой (Tk) в отдельном процессе.
+        :param stats_path: JSON-файл, куда фоновый процесс раз в секунду выгружает статистику (для headless-запусков).
+        :param profile: замерять фазы шага (см. dump_profile); trace_events — сколько отрезков хранить для Chrome trace.
+        :param record_path: каталог для записи траекторий (см. TrajectoryRecorder); None — не записывать.
+        :param record_compress: сжимать чанки траекторий zlib (меньше на диске, но без memmap при чтении).
+        """
         super(MinesweeperEnv, self).__init__()
-        self.frame_height = 8
-        self.frame_width = 8
-        self.minesweeper_bot = MinesweeperBotWeb()
-        self.action_space = spaces.MultiDiscrete([1, self.frame_height, self.frame_width])
+        if isinstance(board_bank, str):
+            board_bank = BoardBank.load(board_bank)
+        if board_bank is not None:
+            height, width, mines = board_bank.height, board_bank.width, board_bank.mine_count
+        self.board_bank = board_bank
+        self.frame_height = height
+        self.frame_width = width
+        self.mine_count = mines
+        self.observation_mode = observation_mode
+        self.auto_resolve = auto_resolve
+        self.probability_engine = MineProbabilityEngine() if mine_probabilities else None
+        # Один таймер на окружение и контроллер браузера, чтобы фазы шага попадали в одну сводку
+        self.timer = PhaseTimer(enabled=profile, trace_events=trace_events)
+        self._step_returned_ns = None
+        if backend == "browser":
+            # Playwright и контроллер страницы нужны только браузерному бэкенду
+            from src.minesweeper_controller import MinesweeperBotWeb
+            self.minesweeper_bot = MinesweeperBotWeb(headless=headless, cdp_endpoint=cdp_endpoint,
+                                                     height=height, width=width, mines=mines, timer=self.timer)
+        elif backend == "engine":
+            self.minesweeper_bot = MinesweeperEngine(height=height, width=width, mines=mines)
+        else:
+            raise ValueError(f"Unknown backend: {backend}, expected one of {BACKENDS}")
+        # Действие — индекс клетки x * width + y; маска допустимых действий в action_masks
+        self.action_space = spaces.Discrete(self.frame_height * self.frame_width)
         self.observation_space = self._initialize_observation_space()
         self.game_state = "inprogress"
         self.wins = 0
@@ -35,57 +71,149 @@ class MinesweeperEnv(gym.Env):
         self.max_reward = 0
         self.reward = 0
         self.steps_counter = 0
+        self.total_steps = 0
         self.field_state = None
+        self.last_observation = None
+        # Запись траекторий: на шаг пишутся только клетки, изменившиеся относительно прошлого поля
+        self.recorder = TrajectoryRecorder(record_path, height, width, compress=record_compress) \
+            if record_path else None
+        self._recorded_field = None
 
-        # Создаём очередь для передачи данных в фоновый процесс
-        self.queue = multiprocessing.Queue()
-
-        # Запуск процесса отображения окна с текстом
-        self.image_process = multiprocessing.Process(target=display_image_with_text, args=(self.queue,))
-        self.image_process.start()
+        # Статистика пишется в разделяемую память, окно и экспортёр читают её со своей частотой.
+        # Без них (воркеры векторного окружения, headless-обучение) счётчики не ведутся вовсе
+        self.stats = None
+        self.stats_processes = []
+        if show_overlay or stats_path:
+            self.stats = SharedStats()
+        if show_overlay:
+            from src.helpers.gui_text import display_image_with_text
+            self.stats_processes.append(multiprocessing.Process(target=display_image_with_text, args=(self.stats.name,),
+                                                                daemon=True))
+        if stats_path:
+            self.stats_processes.append(multiprocessing.Process(target=export_stats, args=(self.stats.name, stats_path),
+                                                                daemon=True))
+        for process in self.stats_processes:
+            process.start()
 
         # Запускаем игру
         self.minesweeper_bot.start_game()
 
     def _initialize_observation_space(self):
-        return spaces.Dict({
-            'field_state': spaces.Box(low=0, high=255, shape=(self.frame_height, self.frame_width), dtype=np.int32),
+        observation_spaces = {
+            'field_state': field_space(self.observation_mode, self.frame_height, self.frame_width),
             'game_state': spaces.Discrete(3)
-        })
+        }
+        if self.probability_engine is not None:
+            observation_spaces['mine_probability'] = spaces.Box(low=0, high=1, shape=(self.frame_height, self.frame_width),
+                                                                dtype=np.float16)
+        return spaces.Dict(observation_spaces)
 
     def reset(self, seed=None, options=None, attempt=0):
         logger.info("Executing reset")
         super().reset(seed=seed)
         self.steps_counter = 0
-        self.minesweeper_bot.restart_game()
-        self.field_state = None
-        observation, info = self._get_observation()
+        # Доска берётся из генератора окружения, так что reset(seed=...) воспроизводим на любом бэкенде
+        if self.board_bank is not None:
+            index = options["board_index"] if options and "board_index" in options \
+                else self.np_random.integers(len(self.board_bank))
+            board = self.board_bank[index]
+        else:
+            board = generate_board(self.np_random, self.frame_height, self.frame_width, self.mine_count)
+        with self.timer.phase("reset"):
+            self.minesweeper_bot.restart_game(board=board)
+            self.field_state = None
+            observation, info = self._get_observation(self.minesweeper_bot.observe())
+        if self.recorder is not None:
+            self.recorder.begin_episode(seed, board)
+            self._recorded_field = np.array(self.field_state).ravel()
         logger.info("Finishing reset")
+        self._mark_step_returned()
         return observation, info
 
+    def action_masks(self):
+        """Маска допустимых действий для MaskablePPO: только закрытые клетки"""
+        return (np.asarray(self.field_state) == CLOSED_CELL).ravel()
+
     def step(self, action):
         logger.info("Executing step")
-        action_type, x, y = action
-        # Выполняем действие: левый клик или правый клик (пометить мину)
-        if self.field_state[x][y] != 99:
-            reward = -10
-            observation, info = self._get_observation()
-            terminated = self._check_done()
+        if self.timer.enabled and self._step_returned_ns is not None:
+            # Время между шагами — инференс политики и накладные расходы SB3
+            self.timer.record("agent", self._step_returned_ns, time.perf_counter_ns())
+        x, y = divmod(int(action), self.frame_width)
+        # Клик по открытой клетке доску не меняет: штраф без обращения к бэкенду.
+        # С маской действий такие клики не выбираются вовсе
+        if self.field_state[x][y] != CLOSED_CELL:
+            if self.recorder is not None:
+                self._record_transition(action, -10, False)
+            self._mark_step_returned()
+            return self.last_observation, -10, False, False, {}
+        with self.timer.phase("step"):
+            # Клик, поле и смайлик за одно обращение к бэкенду
+            with self.timer.phase("backend"):
+                snapshot = self.minesweeper_bot.left_click_and_observe(x, y)
+            self.steps_counter += 1
+            auto_clicks = 0
+            if self.auto_resolve:
+                with self.timer.phase("auto_resolve"):
+                    snapshot, auto_clicks = self._resolve_forced_moves(snapshot)
+            with self.timer.phase("observation"):
+                observation, info = self._get_observation(snapshot)
+            info["auto_clicks"] = auto_clicks
+            with self.timer.phase("reward"):
+                reward = self._calculate_reward()
+                terminated = self._check_done()
             truncated = False
-            return observation, reward, terminated, truncated, info
-        self.minesweeper_bot.left_click(x, y)
-        self.steps_counter += 1
-        observation, info = self._get_observation()
-        reward = self._calculate_reward()
-        terminated = self._check_done()
-        truncated = False
+            if self.stats is not None:
+                self.total_steps += 1
+                self.stats.record(self.wins, self.loses, reward, self.max_reward, self.total_steps,
+                                  self.wins + self.loses)
+            if self.recorder is not None:
+                with self.timer.phase("record"):
+                    self._record_transition(action, reward, terminated)
 
+        self._mark_step_returned()
         return observation, reward, terminated, truncated, info
 
-    def _get_observation(self):
+    def _mark_step_returned(self):
+        if self.timer.enabled:
+            self._step_returned_ns = time.perf_counter_ns()
+
+    def _record_transition(self, action, reward, terminated):
+        field = np.asarray(self.field_state).ravel()
+        cells = np.flatnonzero(field != self._recorded_field)
+        codes = field[cells]
+        self._recorded_field[cells] = codes
+        self.recorder.add(int(action), cells, codes, reward, terminated)
+
+    def dump_profile(self, path):
+        """
+        Сводка замеров (p50/p95/p99 по фазам) в path и Chrome trace в path с суффиксом .trace.json.
+        Возвращает сводку; для векторных окружений вызывается через env_method.
+        """
+        self.timer.dump_json(path)
+        if self.timer.events is not None:
+            self.timer.dump_chrome_trace(os.path.splitext(path)[0] + ".trace.json")
+        return self.timer.summary()
+
+    def _resolve_forced_moves(self, snapshot):
+        """Открытие выводимо безопасных клеток, пока они есть; каждая волна — одно обращение к бэкенду"""
+        clicks = 0
+        while snapshot.game_state == "inprogress":
+            # Решателю нужны мины без флагов, как и в MineProbabilityEngine.probabilities
+            mines_left = self.mine_count - int((snapshot.field_state == FLAG_CELL).sum())
+            safe, _ = find_forced_moves(snapshot.field_state, mines_left)
+            cells = np.argwhere(safe)
+            if not len(cells):
+                break
+            snapshot = self.minesweeper_bot.left_clicks_and_observe(cells)
+            clicks += len(cells)
+        self.steps_counter += clicks
+        return snapshot, clicks
+
+    def _get_observation(self, snapshot):
         logger.info("Get observation")
-        self.game_state = self.minesweeper_bot.get_game_state()
-        self.field_state = self.minesweeper_bot.get_field_state()
+        self.game_state = snapshot.game_state
+        self.field_state = snapshot.field_state
         int_game_state = 0
         if self.game_state == "win":
             int_game_state = 1
@@ -93,10 +221,19 @@ class MinesweeperEnv(gym.Env):
             int_game_state = 2
         elif self.game_state == "inprogress":
             int_game_state = 0
-        return {
-            'field_state': self.field_state,
+        self.last_observation = {
+            'field_state': encode_field(self.field_state, self.observation_mode),
             'game_state': int_game_state
-        }, {}
+        }
+        if self.probability_engine is not None:
+            self.last_observation['mine_probability'] = self._mine_probability()
+        return self.last_observation, {}
+
+    def _mine_probability(self):
+        if self.game_state != "inprogress":
+            # Партия окончена: мины на поле уже видны
+            return np.isin(self.field_state, (FLAG_CELL, MINE_CELL)).astype(np.float16)
+        return self.probability_engine.probabilities(self.field_state, self.mine_count).astype(np.float16)
 
     def _calculate_reward(self):
         logger.info("Calculate reward")
@@ -110,16 +247,12 @@ class MinesweeperEnv(gym.Env):
 
         reward += self.steps_counter * 10
 
-        logger.info(f"Total reward: {reward}")
-        self.queue.put(f"Wins: {self.wins} | Loses: {self.loses}\n"
-                       f"Last reward: {reward}\n"
-                       f"Max reward: {self.max_reward}")
+        logger.info("Total reward: %s", reward)
         self.max_reward = reward if reward > self.max_reward else self.max_reward
         return reward
 
     def _check_done(self):
         logger.info("check_done")
-        self.game_state = self.minesweeper_bot.get_game_state()
 
         if self.game_state in ["win", "lose"]:
             # Обновляем счётчики побед и поражений
@@ -132,9 +265,19 @@ class MinesweeperEnv(gym.Env):
 
     def close(self):
         """
-        Завершение процесса с текстом при завершении работы окружения.
+        Завершение процессов статистики при завершении работы окружения.
         """
-        if self.image_process.is_alive():
-            self.image_process.terminate()
-            self.image_process.join()
+        for process in self.stats_processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.stats_processes = []
+        if self.stats is not None:
+            self.stats.close()
+            self.stats = None
+        if self.recorder is not None:
+            # Дописываем неполный чанк и ждём фоновую запись
+            self.recorder.close()
+            self.recorder = None
+        self.minesweeper_bot.close_game()
         super().close()
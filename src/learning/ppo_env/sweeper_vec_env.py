@@ -0,0 +1,212 @@
+import multiprocessing
+import os
+from functools import partial
+
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecEnv
+
+from src.helpers.stats import SharedStats, export_stats
+from src.learning.ppo_env.factory import EnvFactory
+from src.learning.ppo_env.observations import encode_field, field_space
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL, MINE_CELL, count_neighbor_mines
+
+# Числовые состояния игры такие же, как в MinesweeperEnv._get_observation
+IN_PROGRESS, WIN, LOSE = 0, 1, 2
+
+# Методы, возвращающие значение для каждой доски
+_BATCHED_METHODS = ("action_masks",)
+
+
+def dilate(mask):
+    """Расширение булевой маски (N, H, W) на все 8 соседей"""
+    height, width = mask.shape[-2:]
+    padded = np.pad(mask, [(0, 0), (1, 1), (1, 1)])
+    result = np.zeros_like(mask)
+    for dy in range(3):
+        for dx in range(3):
+            result |= padded[:, dy:dy + height, dx:dx + width]
+    return result
+
+
+class MinesweeperVecEnv(VecEnv):
+    """
+    Векторное окружение: N досок в общих массивах формы (N, H, W).
+    Действия, награды и завершения всех досок считаются одним проходом NumPy,
+    закончившиеся доски перезапускаются автоматически, как в DummyVecEnv.
+    Награды и пространства совпадают с MinesweeperEnv.
+    """
+
+    def __init__(self, num_envs=256, height=8, width=8, mines=10, seed=None, observation_mode="raw", stats_path=None):
+        """
+        :param stats_path: JSON-файл, куда фоновый процесс раз в секунду выгружает общую статистику всех досок.
+        """
+        self.frame_height = height
+        self.frame_width = width
+        self.mine_count = mines
+        self.observation_mode = observation_mode
+        self.render_mode = None
+        self.rng = np.random.default_rng(seed)
+        action_space = spaces.Discrete(height * width)
+        observation_space = spaces.Dict({
+            'field_state': field_space(observation_mode, height, width),
+            'game_state': spaces.Discrete(3)
+        })
+        super().__init__(num_envs, observation_space, action_space)
+
+        shape = (num_envs, height, width)
+        self.mines = np.zeros(shape, dtype=bool)
+        self.counts = np.zeros(shape, dtype=np.int8)
+        self.revealed = np.zeros(shape, dtype=bool)
+        self.field = np.full(shape, CLOSED_CELL, dtype=np.int32)
+        self.backup = np.zeros((num_envs, 2), dtype=np.int64)
+        self.cleared = np.zeros(num_envs, dtype=np.int64)
+        self.steps_counter = np.zeros(num_envs, dtype=np.int64)
+        self.game_state = np.zeros(num_envs, dtype=np.int64)
+        self.wins = 0
+        self.loses = 0
+        self.max_reward = 0
+        self.total_steps = 0
+        self._actions = None
+        # Те же счётчики, что у MinesweeperEnv, но по всем доскам сразу; last_reward — средняя награда шага
+        self.stats = None
+        self.stats_process = None
+        if stats_path:
+            self.stats = SharedStats()
+            self.stats_process = multiprocessing.Process(target=export_stats, args=(self.stats.name, stats_path),
+                                                         daemon=True)
+            self.stats_process.start()
+
+    def _new_boards(self, boards):
+        """Генерация досок с индексами boards: mines+1 позиций, последняя — запасная"""
+        count = len(boards)
+        if count == 0:
+            return
+        cells = self.frame_height * self.frame_width
+        positions = np.argsort(self.rng.random((count, cells)), axis=1)[:, :self.mine_count + 1]
+        mines = np.zeros((count, cells), dtype=bool)
+        np.put_along_axis(mines, positions[:, :-1], True, axis=1)
+        mines = mines.reshape(count, self.frame_height, self.frame_width)
+        self.mines[boards] = mines
+        self.counts[boards] = count_neighbor_mines(mines)
+        self.backup[boards] = np.stack(np.divmod(positions[:, -1], self.frame_width), axis=1)
+        self.revealed[boards] = False
+        self.field[boards] = CLOSED_CELL
+        self.cleared[boards] = 0
+        self.steps_counter[boards] = 0
+        self.game_state[boards] = IN_PROGRESS
+
+    def _observation(self):
+        field = encode_field(self.field, self.observation_mode)
+        return {'field_state': field.copy() if field is self.field else field, 'game_state': self.game_state.copy()}
+
+    def reset(self):
+        if self._seeds[0] is not None:
+            self.rng = np.random.default_rng(self._seeds)
+        self._reset_seeds()
+        self._reset_options()
+        self._new_boards(np.arange(self.num_envs))
+        return self._observation()
+
+    def action_masks(self):
+        """Маски допустимых действий всех досок (N, H * W): только закрытые клетки"""
+        return (self.field == CLOSED_CELL).reshape(self.num_envs, -1)
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions)
+
+    def step_wait(self):
+        boards = np.arange(self.num_envs)
+        rows, cols = np.divmod(self._actions.reshape(-1), self.frame_width)
+
+        # Клик по уже открытой клетке: штраф без изменения доски
+        valid = self.field[boards, rows, cols] == CLOSED_CELL
+        self.steps_counter += valid
+
+        hit_mine = valid & self.mines[boards, rows, cols]
+        # Первый клик по мине: мина переезжает на запасную позицию
+        first = np.flatnonzero(hit_mine & (self.cleared == 0))
+        if len(first):
+            self.mines[first, rows[first], cols[first]] = False
+            self.mines[first, self.backup[first, 0], self.backup[first, 1]] = True
+            self.counts[first] = count_neighbor_mines(self.mines[first])
+        lose = hit_mine & (self.cleared > 0)
+
+        opened = valid & ~lose
+        frontier = np.zeros_like(self.revealed)
+        frontier[boards[opened], rows[opened], cols[opened]] = True
+        # Flood fill сразу для всех досок: расширяем область от открытых нулей
+        while frontier.any():
+            self.revealed |= frontier
+            frontier = dilate(frontier & (self.counts == 0)) & ~self.revealed & ~self.mines
+
+        self.cleared = self.revealed.sum(axis=(1, 2))
+        self.field = np.where(self.revealed, self.counts, CLOSED_CELL).astype(np.int32)
+        win = opened & (self.cleared >= self.frame_height * self.frame_width - self.mine_count)
+        self.game_state[win] = WIN
+        self.game_state[lose] = LOSE
+
+        rewards = np.where(valid, self.steps_counter * 10 + win * 1000 - lose * 500, -10).astype(np.float32)
+        dones = win | lose
+        self.wins += int(win.sum())
+        self.loses += int(lose.sum())
+        self.max_reward = max(self.max_reward, int(rewards.max()))
+        if self.stats is not None:
+            self.total_steps += self.num_envs
+            self.stats.record(self.wins, self.loses, float(rewards.mean()), self.max_reward, self.total_steps,
+                              self.wins + self.loses)
+
+        finished = np.flatnonzero(dones)
+        # Как на странице: при победе мины помечаются флагами, при проигрыше открываются
+        end_codes = np.where(win[finished], FLAG_CELL, MINE_CELL)[:, None, None]
+        self.field[finished] = np.where(self.mines[finished], end_codes, self.field[finished])
+        infos = [{} for _ in range(self.num_envs)]
+        for i in finished:
+            infos[i]["terminal_observation"] = {
+                'field_state': encode_field(self.field[i].copy(), self.observation_mode),
+                'game_state': int(self.game_state[i])
+            }
+            infos[i]["TimeLimit.truncated"] = False
+        self._new_boards(finished)
+        return self._observation(), rewards, dones, infos
+
+    def close(self):
+        if self.stats_process is not None:
+            self.stats_process.terminate()
+            self.stats_process.join()
+            self.stats_process = None
+        if self.stats is not None:
+            self.stats.close()
+            self.stats = None
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # Методы из _BATCHED_METHODS считаются сразу для всех досок, результат раздаётся по индексам
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        if method_name in _BATCHED_METHODS:
+            return [result[i] for i in self._get_indices(indices)]
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
+
+
+def make_browser_vec_env(n_envs, pool, observation_mode="raw", height=8, width=8, mines=10, auto_resolve=False,
+                         mine_probabilities=False, profile=False, trace_events=0, record_path=None,
+                         record_compress=False):
+    """
+    SubprocVecEnv из n_envs окружений с настоящим winmine.html.
+    Все воркеры открывают страницы в одном браузере из запущенного BrowserPool,
+    поэтому стоимость запуска Chromium платится один раз.
+    :param record_path: каталог записи траекторий; каждый воркер пишет в свой подкаталог worker_<i>.
+    """
+    env_fn = EnvFactory("browser", cdp_endpoint=pool.endpoint, observation_mode=observation_mode, height=height,
+                        width=width, mines=mines, auto_resolve=auto_resolve, mine_probabilities=mine_probabilities,
+                        profile=profile, trace_events=trace_events, record_compress=record_compress)
+    return SubprocVecEnv([partial(env_fn, record_path=os.path.join(record_path, f"worker_{index}") if record_path
+                                  else None) for index in range(n_envs)])
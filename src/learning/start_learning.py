@@ -2,34 +2,16 @@ import logging
 import os
 import json
 import argparse
-from stable_baselines3 import PPO, DQN
-from stable_baselines3.common.callbacks import CheckpointCallback, BaseCallback
+from functools import partial
 
 from constants import PPO_CHECKPOINT_DIR, DQN_CHECKPOINT_DIR
-from src.learning.ppo_env.sweeper_env_ppo import MinesweeperEnv
+from src.learning.evaluate import evaluate
+from src.learning.ppo_env.factory import EnvFactory
+from src.learning.ppo_env.observations import OBSERVATION_MODES
+from src.learning.ppo_env.sweeper_env_ppo import BACKENDS
 
-
-class SaveProgressCallback(BaseCallback):
-    n_calls: int = 0
-
-    def __init__(self, save_path, save_freq=100000, verbose=0):
-        super(SaveProgressCallback, self).__init__(verbose)
-        self.save_path = save_path
-        self.save_freq = save_freq
-
-    def _on_step(self) -> bool:
-        if self.n_calls % self.save_freq == 0:
-            if os.path.exists(self.save_path):
-                with open(self.save_path, "r") as f:
-                    data = json.load(f)
-                current_timesteps = data.get("timesteps", 0)
-            else:
-                current_timesteps = 0
-            current_timesteps += self.save_freq
-            with open(self.save_path, "w") as f:
-                json.dump({"timesteps": current_timesteps}, f)
-
-        return True
+# Сколько последних отрезков фаз хранить для Chrome trace при --profile
+PROFILE_TRACE_EVENTS = 100000
 
 
 def setup_logging():
@@ -54,6 +36,12 @@ def load_progress(path):
 
 
 def find_latest_checkpoint(checkpoint_dir, model_type):
+    from src.learning.checkpoints import read_manifest
+
+    # Манифест CheckpointManager указывает последний чекпоинт сразу; обход каталога — для старых запусков без него
+    manifest = read_manifest(checkpoint_dir)
+    if manifest and manifest["latest"] and manifest["latest"].startswith(f'{model_type.lower()}_model'):
+        return os.path.join(checkpoint_dir, manifest["latest"])
     checkpoint_files = [f for f in os.listdir(checkpoint_dir) if f.startswith(f'{model_type.lower()}_model') and f.endswith('.zip')]
     if checkpoint_files:
         checkpoint_files.sort(key=lambda x: os.path.getmtime(os.path.join(checkpoint_dir, x)), reverse=True)
@@ -61,68 +49,195 @@ def find_latest_checkpoint(checkpoint_dir, model_type):
     return None
 
 
-def main(model_type):
+def score_checkpoint(path, games, maskable, mines, auto_resolve=False):
+    """Винрейт чекпоинта для выбора лучшего; вызывается CheckpointManager в процессе оценки"""
+    return evaluate(path, games=games, maskable=maskable, mines=mines, auto_resolve=auto_resolve)["win_rate"]
+
+
+def dump_profile(env, path):
+    """Сводка замеров фаз шага; у векторного окружения — отдельный файл на каждого воркера"""
+    from src.learning.ppo_env.sweeper_vec_env import MinesweeperVecEnv
+
+    if not hasattr(env, "num_envs"):
+        env.dump_profile(path)
+    elif not isinstance(env.unwrapped, MinesweeperVecEnv):
+        base, ext = os.path.splitext(path)
+        for index in range(env.num_envs):
+            env.env_method("dump_profile", f"{base}_{index}{ext}", indices=index)
+
+
+def main(model_type, backend="browser", n_envs=1, observation_mode="raw", maskable=False,
+         height=8, width=8, mines=10, seed=None, auto_resolve=False,
+         mine_probabilities=False, keep_checkpoints=5, eval_games=0, stats_path=None,
+         profile=None, policy="mlp", record_path=None, show_overlay=True,
+         record_compress=False):
     logger = setup_logging()
+    # Тяжёлые зависимости (torch, SB3, Playwright) импортируются здесь и только для выбранного режима,
+    # чтобы импорт модуля (evaluate, воркеры, --help) оставался быстрым
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import VecMonitor
+    from src.learning.checkpoints import AsyncCheckpointCallback, CheckpointManager, SaveProgressCallback
+
+    if policy == "conv" and observation_mode == "raw":
+        logger.error("The convolutional policy needs --observation_mode compact or onehot")
+        return
 
     # Определяем пути и классы в зависимости от типа модели
     if model_type == "PPO":
-        env_class = MinesweeperEnv
         model_class = PPO
         checkpoint_dir = PPO_CHECKPOINT_DIR
+        if maskable:
+            # Маскированная политика не выбирает уже открытые клетки (берёт маску из env.action_masks)
+            from sb3_contrib import MaskablePPO
+            model_class = MaskablePPO
     else:
         logger.error(f"Unsupported model type: {model_type}")
         return
 
     os.makedirs(checkpoint_dir, exist_ok=True)
 
-    checkpoint_callback = CheckpointCallback(
-        save_freq=100000,
-        save_path=checkpoint_dir,
-        name_prefix=f'{model_type.lower()}_model',
-        save_replay_buffer=True
-    )
+    # Частота колбэков считается в вызовах step, а каждый вызов даёт n_envs таймстепов
+    save_freq = max(100000 // n_envs, 1)
+    # Чекпоинты пишутся в фоновом потоке; лучший — по винрейту evaluate в отдельном процессе, если задан eval_games
+    score_fn = None
+    if eval_games > 0:
+        # Партии оценки идут по тем же правилам, что и обучение
+        score_fn = partial(score_checkpoint, games=eval_games, maskable=maskable, mines=mines,
+                           auto_resolve=auto_resolve)
+    checkpoint_manager = CheckpointManager(checkpoint_dir, f'{model_type.lower()}_model', keep_last=keep_checkpoints,
+                                           score_fn=score_fn)
+    checkpoint_callback = AsyncCheckpointCallback(checkpoint_manager, save_freq=save_freq)
 
     progress_file = os.path.join(checkpoint_dir, "progress.json")
-    progress_callback = SaveProgressCallback(save_path=progress_file, save_freq=100000)
+    progress_callback = SaveProgressCallback(save_path=progress_file, save_freq=save_freq)
 
     latest_checkpoint = find_latest_checkpoint(checkpoint_dir, model_type)
     starting_timesteps = load_progress(progress_file)
 
-    env = env_class()
-    if latest_checkpoint:
-        logger.warning(f"Found latest checkpoint: {latest_checkpoint}")
-        try:
-            model = model_class.load(latest_checkpoint)
-            logger.warning("Checkpoint loaded successfully.")
-            logger.warning(f"Restored progress: {starting_timesteps} timesteps")
-        except Exception as e:
-            logger.error(f"Failed to load checkpoint: {e}")
-            logger.warning("Starting training from scratch.")
+    # Общий браузер воркеров; закрывается вместе с окружением. Браузер, окружение и поток записи чекпоинтов
+    # освобождаются и тогда, когда сбой случился ещё до обучения (создание окружения, загрузка модели)
+    pool = None
+    env = None
+    try:
+        if n_envs > 1 and backend == "engine":
+            from src.learning.ppo_env.sweeper_vec_env import MinesweeperVecEnv
+            if auto_resolve or mine_probabilities or profile or record_path:
+                logger.warning("Auto-resolve, mine probabilities, profiling and trajectory recording are not supported "
+                               "by the batched engine environment, ignoring them.")
+            env = VecMonitor(MinesweeperVecEnv(num_envs=n_envs, height=height, width=width, mines=mines, seed=seed,
+                                               observation_mode=observation_mode, stats_path=stats_path))
+        elif n_envs > 1:
+            from src.learning.ppo_env.sweeper_vec_env import make_browser_vec_env
+            from src.minesweeper_controller import BrowserPool
+            if stats_path:
+                logger.warning("Statistics export is not supported by subprocess browser environments, ignoring "
+                               "--stats_path.")
+            # Один headless-браузер на всех воркеров
+            pool = BrowserPool()
+            pool.start()
+            env = VecMonitor(make_browser_vec_env(n_envs, pool, observation_mode=observation_mode,
+                                                  height=height, width=width, mines=mines, auto_resolve=auto_resolve,
+                                                  mine_probabilities=mine_probabilities, profile=bool(profile),
+                                                  trace_events=PROFILE_TRACE_EVENTS if profile else 0,
+                                                  record_path=record_path, record_compress=record_compress))
+            if seed is not None:
+                env.seed(seed)
+        else:
+            env = EnvFactory(backend, headless=False, show_overlay=show_overlay, observation_mode=observation_mode,
+                             height=height, width=width, mines=mines, auto_resolve=auto_resolve,
+                             mine_probabilities=mine_probabilities, stats_path=stats_path, profile=bool(profile),
+                             trace_events=PROFILE_TRACE_EVENTS if profile else 0, record_path=record_path,
+                             record_compress=record_compress)()
+            env.reset(seed=seed)
+
+        # Свёрточная политика не зависит от размера поля: её можно продолжить учить на поле другого размера
+        policy_class = "MultiInputPolicy"
+        if policy == "conv":
+            from src.learning.ppo_env import conv_policy
+            policy_class = conv_policy.MaskableConvCellPolicy if maskable else conv_policy.ConvCellPolicy
+
+        # Компактные наблюдения храним в буфере в их собственном dtype, а не во float32
+        model_kwargs = {}
+        if observation_mode != "raw":
+            from src.learning.ppo_env import buffers
+            model_kwargs["rollout_buffer_class"] = buffers.CompactMaskableDictRolloutBuffer if maskable \
+                else buffers.CompactDictRolloutBuffer
+
+        if latest_checkpoint:
+            logger.warning(f"Found latest checkpoint: {latest_checkpoint}")
+            try:
+                # Окружение передаётся сразу, чтобы несовпадение пространств попало в обработку ошибки
+                model = model_class.load(latest_checkpoint, env=env)
+                logger.warning("Checkpoint loaded successfully.")
+                logger.warning(f"Restored progress: {starting_timesteps} timesteps")
+            except Exception as e:
+                logger.error(f"Failed to load checkpoint: {e}")
+                logger.warning("Starting training from scratch.")
+                if model_type == "DQN":
+                    model = model_class("MultiInputPolicy", env, buffer_size=10000, verbose=1)  # Уменьшенный buffer_size
+                else:
+                    model = model_class(policy_class, env, verbose=1, **model_kwargs)
+                    if policy == "conv":
+                        try:
+                            conv_policy.transfer_policy(model, latest_checkpoint)
+                            logger.warning("Transferred convolutional policy weights to the new board size.")
+                        except Exception as e:
+                            logger.error(f"Failed to transfer policy weights: {e}")
+        else:
+            logger.warning("No checkpoint found. Creating a new model.")
             if model_type == "DQN":
                 model = model_class("MultiInputPolicy", env, buffer_size=10000, verbose=1)  # Уменьшенный buffer_size
             else:
-                model = model_class("MultiInputPolicy", env, verbose=1)
-    else:
-        logger.warning("No checkpoint found. Creating a new model.")
-        if model_type == "DQN":
-            model = model_class("MultiInputPolicy", env, buffer_size=10000, verbose=1)  # Уменьшенный buffer_size
-        else:
-            model = model_class("MultiInputPolicy", env, verbose=1)
-
-    # Убедитесь, что модель использует правильное окружение
-    if not model.get_env():
-        model.set_env(env)
-
-    # Чтение общего количества таймстепов и установка новой цели
-    total_timesteps = 10000000
-    while True:
-        model.learn(total_timesteps=total_timesteps, callback=[checkpoint_callback, progress_callback],
-                    reset_num_timesteps=False)
-        model.save(f"{os.path.join(checkpoint_dir, model_type.lower())}_drone_model_{load_progress(progress_file)}")
+                model = model_class(policy_class, env, verbose=1, **model_kwargs)
+
+        # Убедитесь, что модель использует правильное окружение
+        if not model.get_env():
+            model.set_env(env)
+
+        # Чтение общего количества таймстепов и установка новой цели
+        total_timesteps = 10000000
+        while True:
+            model.learn(total_timesteps=total_timesteps, callback=[checkpoint_callback, progress_callback],
+                        reset_num_timesteps=False)
+            checkpoint_manager.save(model)
+    finally:
+        # Дописываем чекпоинты из очереди, в том числе при остановке по Ctrl+C
+        checkpoint_manager.close()
+        if env is not None:
+            if profile:
+                dump_profile(env, profile)
+                logger.warning(f"Step profile written to {profile}")
+            # Закрытие окружения дописывает незавершённые чанки траекторий
+            env.close()
+        if pool is not None:
+            pool.close()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Choose the model type for training (PPO or DQN).")
     parser.add_argument('--model_type', type=str, choices=['PPO', 'DQN'], required=True, help="The model type to use for training (PPO or DQN).", default="PPO")
+    parser.add_argument('--backend', type=str, choices=BACKENDS, default="browser", help="Game backend: real winmine.html in a browser or the headless NumPy engine.")
+    parser.add_argument('--n_envs', type=int, default=1, help="Number of parallel games: one batched environment for the engine backend, subprocess workers sharing one browser for the browser backend.")
+    parser.add_argument('--observation_mode', type=str, choices=OBSERVATION_MODES, default="raw", help="Board encoding: raw controller codes, dense int8 codes or one-hot uint8 planes.")
+    parser.add_argument('--maskable', action='store_true', help="Train MaskablePPO from sb3-contrib so already revealed cells are never sampled.")
+    parser.add_argument('--height', type=int, default=8, help="Board height.")
+    parser.add_argument('--width', type=int, default=8, help="Board width.")
+    parser.add_argument('--mines', type=int, default=10, help="Mine count.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for board generation, for reproducible runs.")
+    parser.add_argument('--auto_resolve', action='store_true', help="Open cells the constraint solver proves safe after every agent move.")
+    parser.add_argument('--mine_probabilities', action='store_true', help="Add a float16 plane of per-cell mine probabilities to the observation.")
+    parser.add_argument('--keep_checkpoints', type=int, default=5, help="Number of most recent checkpoints to keep on disk (at least 1), besides the best one.")
+    parser.add_argument('--eval_games', type=int, default=0, help="Pick the best checkpoint by win rate over this many seeded games (default: by mean training reward).")
+    parser.add_argument('--stats_path', type=str, default=None, help="Export win/loss/reward/speed counters to this JSON file once a second (single environment or the batched engine environment; last_reward is the mean over boards there).")
+    parser.add_argument('--profile', type=str, default=None, help="Time every step phase and write p50/p95/p99 per phase to this JSON file on exit (plus a Chrome trace next to it).")
+    parser.add_argument('--policy', type=str, choices=['mlp', 'conv'], default="mlp", help="Policy network: MLP over the flattened board, or a fully convolutional size-agnostic network with per-cell logits (needs compact or onehot observations).")
+    parser.add_argument('--record_path', type=str, default=None, help="Record every transition (action, changed cells, reward, terminal) to chunked trajectory files in this directory.")
+    parser.add_argument('--record_compress', action='store_true', help="Compress recorded trajectory chunks with zlib (smaller files, read without memory mapping).")
+    parser.add_argument('--no_overlay', action='store_true', help="Do not open the Tk statistics window for a single environment (needed on headless machines without a display).")
     args = parser.parse_args()
-    main(args.model_type)
+    if args.keep_checkpoints < 1:
+        parser.error("--keep_checkpoints must be at least 1")
+    main(args.model_type, args.backend, args.n_envs, args.observation_mode, args.maskable,
+         args.height, args.width, args.mines, args.seed, args.auto_resolve, args.mine_probabilities,
+         args.keep_checkpoints, args.eval_games, args.stats_path, args.profile, args.policy,
+         args.record_path, not args.no_overlay, args.record_compress)
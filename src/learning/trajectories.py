@@ -0,0 +1,251 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+from src.minesweeper_engine import CLOSED_CELL
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"SWTRAJ1\n"
+_ALIGNMENT = 64
+
+
+def _write_chunk(path, header, columns, compress):
+    """
+    Файл чанка: сигнатура, длина и JSON-заголовок, затем колонки, выровненные по 64 байта.
+    Несжатые колонки читаются через np.memmap без загрузки файла целиком.
+    """
+    blobs, offset = {}, 0
+    for name, array in columns.items():
+        data = np.ascontiguousarray(array).tobytes()
+        if compress:
+            data = zlib.compress(data, 6)
+        blobs[name] = data
+        header["columns"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset,
+                                   "nbytes": len(data)}
+        offset += -(-len(data) // _ALIGNMENT) * _ALIGNMENT
+    encoded = json.dumps(header).encode()
+    # Данные начинаются с выровненной позиции после заголовка
+    data_start = -(-(len(_MAGIC) + 8 + len(encoded)) // _ALIGNMENT) * _ALIGNMENT
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC + struct.pack("<Q", len(encoded)) + encoded)
+        for name, data in blobs.items():
+            f.seek(data_start + header["columns"][name]["offset"])
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+class TrajectoryRecorder:
+    """
+    Запись партий окружения в чанки колоночного формата для офлайн-анализа, обучения с учителем
+    (например, на ходах решателя) и воспроизведения.
+    На партию пишется сид и позиции мин, на переход — действие, изменившиеся клетки (индекс и код),
+    награда и признак конца. Горячий цикл только добавляет значения в списки; полный чанк
+    собирается в массивы и пишется на диск фоновым потоком.
+    """
+
+    def __init__(self, directory, height, width, chunk_size=65536, compress=False):
+        """
+        :param chunk_size: число переходов в чанке.
+        :param compress: сжимать колонки zlib; такие чанки меньше, но читаются целиком, а не через memmap.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.height = height
+        self.width = width
+        self.chunk_size = chunk_size
+        self.compress = compress
+        # Продолжаем нумерацию чанков и партий, если в каталоге уже есть запись
+        existing = sorted(glob.glob(os.path.join(directory, "chunk_*.traj")))
+        self.chunk_index = len(existing)
+        self.episode = TrajectoryReader(directory).episode_count() if existing else 0
+        self.episode -= 1
+        self._new_chunk()
+        self.queue = queue.Queue(maxsize=4)
+        self.thread = threading.Thread(target=self._run, name="trajectory-writer", daemon=True)
+        self.thread.start()
+
+    def _new_chunk(self):
+        self.transitions = {"episode": [], "action": [], "reward": [], "terminated": [], "delta_count": []}
+        self.delta_cells = []
+        self.delta_codes = []
+        self.episodes = {"episode": [], "seed": [], "board": []}
+
+    def begin_episode(self, seed, board):
+        """
+        Начало партии.
+        :param seed: сид reset или None.
+        :param board: позиции мин из generate_board (последняя — запасная).
+        """
+        self.episode += 1
+        self.episodes["episode"].append(self.episode)
+        self.episodes["seed"].append(-1 if seed is None else seed)
+        self.episodes["board"].append(np.asarray(board))
+
+    def add(self, action, cells, codes, reward, terminated):
+        """Переход: cells — плоские индексы изменившихся клеток, codes — их новые коды"""
+        transitions = self.transitions
+        transitions["episode"].append(self.episode)
+        transitions["action"].append(action)
+        transitions["reward"].append(reward)
+        transitions["terminated"].append(terminated)
+        transitions["delta_count"].append(len(cells))
+        self.delta_cells.append(cells)
+        self.delta_codes.append(codes)
+        if len(transitions["action"]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Передача накопленного чанка фоновому потоку"""
+        if not self.transitions["action"] and not self.episodes["episode"]:
+            return
+        self.queue.put((self.chunk_index, self.transitions, self.delta_cells, self.delta_codes, self.episodes))
+        self.chunk_index += 1
+        self._new_chunk()
+
+    def close(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                logger.error(f"Failed to write trajectory chunk: {e}")
+
+    def _write(self, chunk_index, transitions, delta_cells, delta_codes, episodes):
+        counts = np.asarray(transitions["delta_count"], dtype=np.int64)
+        columns = {
+            "episode": np.asarray(transitions["episode"], dtype=np.int64),
+            "action": np.asarray(transitions["action"], dtype=np.int32),
+            "reward": np.asarray(transitions["reward"], dtype=np.float32),
+            "terminated": np.asarray(transitions["terminated"], dtype=np.bool_),
+            # Изменения перехода i — delta_cells[delta_offset[i]:delta_offset[i + 1]]
+            "delta_offset": np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            "delta_cells": np.concatenate(delta_cells).astype(np.int32) if delta_cells else np.zeros(0, np.int32),
+            "delta_codes": np.concatenate(delta_codes).astype(np.int8) if delta_codes else np.zeros(0, np.int8),
+            "episode_id": np.asarray(episodes["episode"], dtype=np.int64),
+            "episode_seed": np.asarray(episodes["seed"], dtype=np.int64),
+        }
+        if episodes["board"]:
+            columns["episode_board"] = np.stack(episodes["board"]).astype(np.int32)
+        header = {"height": self.height, "width": self.width, "compressed": self.compress,
+                  "transitions": len(columns["action"]), "episodes": len(columns["episode_id"]), "columns": {}}
+        _write_chunk(os.path.join(self.directory, f"chunk_{chunk_index:06d}.traj"), header, columns, self.compress)
+
+
+class TrajectoryReader:
+    """
+    Чтение записи TrajectoryRecorder: перебор чанков, доступ к переходу по глобальному номеру
+    и восстановление полей партии. Несжатые колонки отображаются в память, а не загружаются.
+    """
+
+    def __init__(self, directory):
+        self.paths = sorted(glob.glob(os.path.join(directory, "chunk_*.traj")))
+        self.headers = [self._read_header(path) for path in self.paths]
+        self.starts = np.concatenate([[0], np.cumsum([header["transitions"] for header in self.headers])]).tolist()
+        self._columns = {}
+
+    @staticmethod
+    def _read_header(path):
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a trajectory chunk")
+            (length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length))
+        header["data_start"] = -(-(len(_MAGIC) + 8 + length) // _ALIGNMENT) * _ALIGNMENT
+        return header
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def episode_count(self):
+        return sum(header["episodes"] for header in self.headers)
+
+    def chunk(self, index):
+        """Колонки чанка: np.memmap для несжатых, массивы в памяти для сжатых"""
+        if index not in self._columns:
+            path, header = self.paths[index], self.headers[index]
+            columns = {}
+            for name, column in header["columns"].items():
+                dtype, shape = np.dtype(column["dtype"]), tuple(column["shape"])
+                offset = header["data_start"] + column["offset"]
+                if header["compressed"]:
+                    with open(path, "rb") as f:
+                        f.seek(offset)
+                        data = zlib.decompress(f.read(column["nbytes"]))
+                    columns[name] = np.frombuffer(data, dtype=dtype).reshape(shape)
+                elif column["nbytes"] == 0:
+                    columns[name] = np.zeros(shape, dtype=dtype)
+                else:
+                    columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+            self._columns[index] = columns
+        return self._columns[index]
+
+    def iter_chunks(self):
+        for index in range(len(self.paths)):
+            yield self.chunk(index)
+
+    def __getitem__(self, index):
+        """Переход по глобальному номеру: словарь с episode, action, reward, terminated, cells, codes"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        chunk_index = bisect.bisect_right(self.starts, index) - 1
+        columns = self.chunk(chunk_index)
+        local = index - self.starts[chunk_index]
+        start, end = columns["delta_offset"][local], columns["delta_offset"][local + 1]
+        return {
+            "episode": int(columns["episode"][local]),
+            "action": int(columns["action"][local]),
+            "reward": float(columns["reward"][local]),
+            "terminated": bool(columns["terminated"][local]),
+            "cells": np.asarray(columns["delta_cells"][start:end]),
+            "codes": np.asarray(columns["delta_codes"][start:end]),
+        }
+
+    def __iter__(self):
+        for chunk_index in range(len(self.paths)):
+            for index in range(self.starts[chunk_index], self.starts[chunk_index + 1]):
+                yield self[index]
+
+    def episodes(self):
+        """Таблица партий: номер, сид (-1 — без сида) и позиции мин"""
+        tables = [self.chunk(index) for index in range(len(self.paths)) if self.headers[index]["episodes"]]
+        if not tables:
+            return {"episode": np.zeros(0, np.int64), "seed": np.zeros(0, np.int64), "board": np.zeros((0, 0), np.int32)}
+        return {
+            "episode": np.concatenate([table["episode_id"] for table in tables]),
+            "seed": np.concatenate([table["episode_seed"] for table in tables]),
+            "board": np.concatenate([table["episode_board"] for table in tables]),
+        }
+
+    def replay(self, episode):
+        """
+        Поля партии после каждого перехода, восстановленные из изменений.
+        :return: генератор пар (переход, поле (H, W) int8).
+        """
+        header = self.headers[0]
+        field = np.full(header["height"] * header["width"], CLOSED_CELL, dtype=np.int8)
+        for chunk_index in range(len(self.paths)):
+            columns = self.chunk(chunk_index)
+            positions = np.flatnonzero(np.asarray(columns["episode"]) == episode)
+            for local in positions:
+                transition = self[self.starts[chunk_index] + int(local)]
+                field[transition["cells"]] = transition["codes"]
+                yield transition, field.reshape(header["height"], header["width"]).copy()
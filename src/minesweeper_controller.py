@@ -1,54 +1,255 @@
+import base64
+import json
 import os
+import socket
 import time
-from dataclasses import dataclass
 from enum import Enum
+from itertools import repeat
+from typing import NamedTuple
+from urllib.parse import urlencode
 
-from playwright.sync_api import sync_playwright, Page
+import numpy as np
+
+from src.helpers.profiling import PhaseTimer
+
+
+# Коды клеток в get_field_state
+CLOSED_CELL = 99
+MINE_CELL = -77
+FLAG_CELL = -1
 
 
-@dataclass
 class CellDataEnum(Enum):
-    EMPTY = "cell size24 hd_opened hd_type0"
-    N1 = "cell size24 hd_opened hd_type1"
-    N2 = "cell size24 hd_opened hd_type2"
-    N3 = "cell size24 hd_opened hd_type3"
-    N4 = "cell size24 hd_opened hd_type4"
-    N5 = "cell size24 hd_opened hd_type5"
-    N6 = "cell size24 hd_opened hd_type6"
-    N7 = "cell size24 hd_opened hd_type71"
-    N8 = "cell size24 hd_opened hd_type8"
-    FLAG_WITH_NO_MINE = "cell size24 hd_opened hd_type12"
-    MINE = "cell size24 hd_opened hd_type11"
-    CLOSED = "cell size24 hd_closed"
-    FLAG = "cell size24 hd_closed hd_flag"
+    """Значения атрибута class клеток winmine.html"""
+    EMPTY = "clear"
+    N1 = "clear c1"
+    N2 = "clear c2"
+    N3 = "clear c3"
+    N4 = "clear c4"
+    N5 = "clear c5"
+    N6 = "clear c6"
+    N7 = "clear c7"
+    N8 = "clear c8"
+    FLAG_WITH_NO_MINE = "notmine"
+    MINE = "clear mine"
+    TRIGGERED_MINE = "clear triggered-mine mine"
+    CLOSED = ""
+    FLAG = "flag"
+
+
+# Единая таблица класс -> код для Python (get_cell_state, classify_cells) и страницы (cellStateMap),
+# всё, чего в ней нет, получает MINE_CELL
+CELL_CODES = {
+    CellDataEnum.CLOSED.value: CLOSED_CELL,
+    CellDataEnum.FLAG.value: FLAG_CELL,
+    CellDataEnum.MINE.value: MINE_CELL,
+    CellDataEnum.TRIGGERED_MINE.value: MINE_CELL,
+    CellDataEnum.FLAG_WITH_NO_MINE.value: MINE_CELL,
+    CellDataEnum.EMPTY.value: 0,
+    **{CellDataEnum[f"N{n}"].value: n for n in range(1, 9)},
+}
+
+def classify_cells(class_names):
+    """
+    Коды клеток для всех значений class поля одним вызовом: поиск по CELL_CODES идёт через map в C,
+    без Python-ветвлений на каждую клетку.
+    :param class_names: плоская последовательность строк или массив NumPy любой формы.
+    :return: массив int8 той же формы.
+    """
+    if isinstance(class_names, np.ndarray):
+        shape, class_names = class_names.shape, class_names.ravel().tolist()
+    else:
+        shape = (len(class_names),)
+    codes = map(CELL_CODES.get, class_names, repeat(MINE_CELL))
+    return np.fromiter(codes, dtype=np.int8, count=len(class_names)).reshape(shape)
+
+
+# Чтение поля и смайлика на стороне страницы, общее для всех запросов к доске
+_READ_BOARD_JS = f"""
+    // Маппинг классов клеток к их числовым состояниям из CELL_CODES, всё неизвестное — MINE_CELL
+    const cellStateMap = {json.dumps(CELL_CODES)};
+    const unknownCellCode = {MINE_CELL};
+""" + """
+    // Точное соответствие класса
+    const cellCode = (cell) => {
+        const cell_state = cellStateMap[cell.className];
+        return cell_state !== undefined ? cell_state : unknownCellCode;
+    };
+    // Упаковка типизированного массива в base64: по мосту CDP идёт одна строка вместо массивов JS
+    const toBase64 = (typed) => {
+        const bytes = new Uint8Array(typed.buffer, typed.byteOffset, typed.byteLength);
+        let binary = "";
+        for (let i = 0; i < bytes.length; i += 0x8000) {
+            binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+        }
+        return btoa(binary);
+    };
+    const cellIndex = (cell) => {
+        const parts = cell.id.split("_");
+        return parseInt(parts[1]) * winmine.width + parseInt(parts[2]);
+    };
+    // Всё поле построчно: по одному байту int8 на клетку
+    const readField = () => {
+        const field = new Int8Array(winmine.height * winmine.width);
+        document.querySelectorAll("[id^='cell_']").forEach(cell => {
+            field[cellIndex(cell)] = cellCode(cell);
+        });
+        return [toBase64(field), winmine.height, winmine.width];
+    };
+    // Клетки, у которых сменился класс с прошлого вызова: int32 на клетку, (индекс << 8) | код.
+    // takeRecords забирает записи, которые MutationObserver ещё не успел доставить в колбэк.
+    const readChanges = () => {
+        const changed = window.__sweeperChanged;
+        for (const record of window.__sweeperObserver.takeRecords()) {
+            changed.add(record.target);
+        }
+        const changes = new Int32Array(changed.size);
+        let i = 0;
+        changed.forEach(cell => {
+            changes[i++] = (cellIndex(cell) << 8) | (cellCode(cell) & 0xFF);
+        });
+        changed.clear();
+        return toBase64(changes);
+    };
+    const readGameState = () => {
+        const face = document.getElementsByClassName("smiley-container")[0].className;
+        if (face.includes("game-over")) {
+            return "lose";
+        }
+        return face.includes("win") ? "win" : "inprogress";
+    };
+"""
+
+# Подписка на изменения классов клеток; ставится заново после каждой загрузки страницы
+_WATCH_BOARD_JS = """
+    window.__sweeperChanged = new Set();
+    window.__sweeperObserver = new MutationObserver(records => {
+        for (const record of records) {
+            window.__sweeperChanged.add(record.target);
+        }
+    });
+    window.__sweeperObserver.observe(document.getElementsByClassName("cell-container")[0],
+        {subtree: true, attributes: true, attributeFilter: ["class"]});
+"""
+
+
+class GameSnapshot(NamedTuple):
+    """Результат одного обращения к доске: поле в кодах get_field_state и состояние игры"""
+    field_state: np.ndarray
+    game_state: str
+
+
+class BrowserPool:
+    """
+    Один headless Chromium на все окружения. Воркеры SubprocVecEnv подключаются
+    к нему по CDP и открывают в нём свои контексты и страницы.
+    """
+
+    def __init__(self, headless=True, port=None):
+        self.headless = headless
+        self.port = port
+        self.endpoint = None
+        self.playwright = None
+        self.browser = None
+
+    def start(self):
+        """Запуск браузера с открытым портом удалённой отладки"""
+        if self.port is None:
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                self.port = sock.getsockname()[1]
+        # Playwright нужен только браузерному бэкенду: движок и воркеры без браузера его не импортируют
+        from playwright.sync_api import sync_playwright
+
+        self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(headless=self.headless,
+                                                       args=[f"--remote-debugging-port={self.port}"])
+        self.endpoint = f"http://127.0.0.1:{self.port}"
+        return self.endpoint
+
+    def close(self):
+        """Закрытие общего браузера"""
+        if self.browser:
+            self.browser.close()
+        if self.playwright:
+            self.playwright.stop()
+
+
 class MinesweeperBotWeb:
     _game_block_selector = "//div[@class='game-window-frame']"
     _face_selector = "//div[contains(@class,'smiley-container')]"
     _cell_selector = "//div[@id='cell_{x}_{y}']"
 
-    def __init__(self):
+    def __init__(self, headless=False, cdp_endpoint=None, height=8, width=8, mines=10, timer=None):
         """
-        :param url: URL страницы с веб-версией Сапера.
+        :param headless: запуск собственного браузера без окна.
+        :param cdp_endpoint: адрес общего браузера из BrowserPool; если задан, свой браузер не запускается.
+        :param height, width, mines: размер поля и число мин, передаются странице через URL.
+        :param timer: PhaseTimer для замеров загрузки страницы, page.evaluate и разбора ответа; по умолчанию выключен.
         """
         current_directory = os.path.dirname(os.path.abspath(__file__))
         file_path = os.path.join(current_directory, "winmine.html")
-        self.url = f"file://{file_path}?height=8&width=8&mines=10"
+        self.height = height
+        self.width = width
+        self.mine_count = mines
+        self.base_url = f"file://{file_path}?height={height}&width={width}&mines={mines}"
+        self.url = self.base_url
+        self.headless = headless
+        self.cdp_endpoint = cdp_endpoint
+        self.playwright = None
         self.browser = None
-        self.page:Page = None
+        self.page = None
         self.context = None
+        # Последнее известное поле; после загрузки страницы обновляется только изменившимися клетками
+        self.field = None
+        self.timer = timer or PhaseTimer()
 
     def start_game(self):
-        """Запуск браузера и загрузка страницы игры"""
-        playwright = sync_playwright().start()
-        self.browser = playwright.chromium.launch(headless=False)  # Отключаем headless для наблюдения
-        self.context = self.browser.new_context()
-        self.page:Page = self.context.new_page()
-        self.page.goto(self.url)
-        self.page.locator(self._face_selector).click()
-        self.page.wait_for_timeout(1000)
-    def restart_game(self):
-        """Перезапуск игры (будет заполнено с селектором кнопки перезапуска)"""
-        self.page.locator(self._face_selector).click()
+        """Запуск (или подключение к общему) браузера и загрузка страницы игры"""
+        from playwright.sync_api import sync_playwright
+
+        self.playwright = sync_playwright().start()
+        try:
+            if self.cdp_endpoint:
+                self.browser = self.playwright.chromium.connect_over_cdp(self.cdp_endpoint)
+            else:
+                self.browser = self.playwright.chromium.launch(headless=self.headless)
+            self.context = self.browser.new_context()
+            self.page = self.context.new_page()
+            self._load_page()
+        except Exception:
+            # Иначе оставшийся цикл событий Playwright не даст запустить его в этом процессе снова
+            self.close_game()
+            raise
+
+    def _load_page(self):
+        # Вместо фиксированной паузы ждём, пока страница построит поле
+        with self.timer.phase("page_load"):
+            self.page.goto(self.url)
+            self.page.wait_for_selector("#cell_0_0", state="attached")
+            self.field = self._read_field(_WATCH_BOARD_JS)
+
+    def _read_field(self, setup_js=""):
+        encoded, height, width = self.page.evaluate(f"() => {{ {_READ_BOARD_JS} {setup_js} return readField(); }}")
+        # bytearray даёт записываемый буфер без копирования; новый буфер на каждую доску,
+        # чтобы не портить наблюдения завершённой игры, которые ещё держит SB3
+        return np.frombuffer(bytearray(base64.b64decode(encoded)), dtype=np.int8).reshape(height, width)
+
+    def read_field(self):
+        """Полное чтение поля со страницы, без учёта изменений (для проверки и замеров)"""
+        return self._read_field()
+
+    def restart_game(self, board=None):
+        """
+        Перезапуск игры на той же странице (смайлик делает то же самое через window.location).
+        :param board: позиции мин из generate_board; передаются странице параметрами board_mines и
+                      board_backup_mine (режим "Play Again"), иначе доску генерирует сама страница.
+        """
+        self.url = self.base_url
+        if board is not None:
+            cells = [f"{position // self.width}_{position % self.width}" for position in board]
+            self.url += "&" + urlencode({"board_mines": json.dumps(cells[:-1]), "board_backup_mine": cells[-1]})
+        self._load_page()
 
     def left_click(self, x, y):
         """Левый клик по координате (x, y) (будет заполнено селекторами ячеек)"""
@@ -70,83 +271,65 @@ class MinesweeperBotWeb:
             return "inprogress"
 
     def get_cell_state(self, class_attr):
-        if CellDataEnum.CLOSED.value == class_attr:
-            return 99
-        elif CellDataEnum.FLAG.value == class_attr:
-            return -1
-        elif CellDataEnum.MINE.value == class_attr:
-            return -99
-        elif CellDataEnum.FLAG_WITH_NO_MINE.value == class_attr:
-            return -999
-        elif CellDataEnum.EMPTY.value == class_attr:
-            return 0
-        elif CellDataEnum.N1.value == class_attr:
-            return 1
-        elif CellDataEnum.N2.value == class_attr:
-            return 2
-        elif CellDataEnum.N3.value == class_attr:
-            return 3
-        elif CellDataEnum.N4.value == class_attr:
-            return 4
-        elif CellDataEnum.N5.value == class_attr:
-            return 5
-        elif CellDataEnum.N6.value == class_attr:
-            return 6
-        elif CellDataEnum.N7.value == class_attr:
-            return 7
-        elif CellDataEnum.N8.value == class_attr:
-            return 8
+        """Код клетки по значению class"""
+        return CELL_CODES.get(class_attr, MINE_CELL)
+
+    def get_cell_states(self, class_names):
+        """Коды для массива значений class (см. classify_cells)"""
+        return classify_cells(class_names)
+
+    def _apply_changes(self, encoded):
+        with self.timer.phase("decode"):
+            packed = np.frombuffer(base64.b64decode(encoded), dtype="<i4")
+            if len(packed):
+                self.field.flat[packed >> 8] = (packed & 0xFF).astype(np.uint8).view(np.int8)
 
     def get_field_state(self):
-        field_res = self.page.evaluate('''
-            () => {
-                const cells = document.querySelectorAll("[id^='cell_']");
-                const field = [];
-
-                // Маппинг классов клеток к их числовым состояниям
-                const cellStateMap = {
-                    "": 99,                     // CLOSED
-                    "clear mine": -77,            // OTHER MINES
-                    "clear triggered-mine mine": -77,           // EXPL MINE
-                    "clear": 0,              // EMPTY
-                    "clear c1": 1,              // N1
-                    "clear c2": 2,              // N2
-                    "clear c3": 3,              // N3
-                    "clear c4": 4,              // N4
-                    "clear c5": 5,              // N5
-                    "clear c6": 6,              // N6
-                    "clear c7": 7,             // N7
-                    "clear c8": 8,               // N8
-                };
-
-                cells.forEach(cell => {
-                    const id_attr = cell.id;
-                    const class_attr = cell.className;
-                    const col_index = parseInt(id_attr.split("_")[2]);
-                    const row_index = parseInt(id_attr.split("_")[1]);
-
-                    if (!field[row_index]) {
-                        field[row_index] = [];
-                    }
-
-                    // Точное соответствие класса
-                    const cell_state = cellStateMap[class_attr] !== undefined ? cellStateMap[class_attr] : null;
-
-                    field[row_index][col_index] = cell_state;
-                });
-
-                return field;
-            }
-        ''')
-        for y, row in enumerate(field_res):
-            for x, value in enumerate(row):
-                if value is None:
-                    field_res[y][x] = -77
-        return field_res
+        """
+        Поле в числовых кодах (int8): с браузера приходят только клетки, изменившиеся с прошлого вызова.
+        Возвращается внутренний буфер, он переиспользуется до перезапуска игры.
+        """
+        self._apply_changes(self.page.evaluate(f"() => {{ {_READ_BOARD_JS} return readChanges(); }}"))
+        return self.field
+
+    def observe(self):
+        """Поле и состояние игры за один вызов page.evaluate"""
+        with self.timer.phase("evaluate"):
+            changes, game_state = self.page.evaluate(
+                f"() => {{ {_READ_BOARD_JS} return [readChanges(), readGameState()]; }}")
+        self._apply_changes(changes)
+        return GameSnapshot(self.field, game_state)
+
+    def left_click_and_observe(self, x, y):
+        """
+        Левый клик, чтение поля и состояния смайлика в одном page.evaluate:
+        один IPC-переход вместо клика через локатор и нескольких чтений атрибутов.
+        """
+        return self.left_clicks_and_observe([(x, y)])
+
+    def left_clicks_and_observe(self, cells):
+        """Несколько левых кликов подряд (например, все безопасные клетки от решателя) за один page.evaluate"""
+        with self.timer.phase("evaluate"):
+            changes, game_state = self.page.evaluate(f"""(cells) => {{
+                {_READ_BOARD_JS}
+                const options = {{bubbles: true, cancelable: true, button: 0}};
+                for (const [x, y] of cells) {{
+                    const cell = document.getElementById(`cell_${{x}}_${{y}}`);
+                    cell.dispatchEvent(new MouseEvent('mousedown', options));
+                    cell.dispatchEvent(new MouseEvent('mouseup', options));
+                }}
+                return [readChanges(), readGameState()];
+            }}""", [[int(x), int(y)] for x, y in cells])
+        self._apply_changes(changes)
+        return GameSnapshot(self.field, game_state)
 
     def close_game(self):
-        """Закрытие браузера"""
-        if self.browser:
+        """Закрытие браузера (для общего браузера — только своего контекста)"""
+        if self.cdp_endpoint and self.context:
+            self.context.close()
+        elif self.browser:
             self.browser.close()
+        if self.playwright:
+            self.playwright.stop()
 
 
@@ -0,0 +1,185 @@
+import numpy as np
+
+# Коды клеток совпадают с тем, что отдаёт MinesweeperBotWeb.get_field_state
+from src.minesweeper_controller import CLOSED_CELL, FLAG_CELL, MINE_CELL, GameSnapshot
+
+
+def count_neighbor_mines(mines):
+    """
+    Количество мин среди соседей каждой клетки (аналог winmine.get_neighbor_mine_freq).
+    :param mines: булев массив формы (..., H, W), допускается пакет досок.
+    :return: массив int8 той же формы.
+    """
+    height, width = mines.shape[-2:]
+    pad = [(0, 0)] * (mines.ndim - 2) + [(1, 1), (1, 1)]
+    padded = np.pad(mines.astype(np.int8), pad)
+    counts = np.zeros(mines.shape, dtype=np.int8)
+    for dy in range(3):
+        for dx in range(3):
+            if dy == 1 and dx == 1:
+                continue
+            counts += padded[..., dy:dy + height, dx:dx + width]
+    return counts
+
+
+def generate_board(rng, height, width, mines):
+    """
+    Доска как в winmine.html: mines+1 различных клеток (плоские индексы), последняя — запасная
+    позиция, куда переезжает мина при первом клике.
+    """
+    return rng.choice(height * width, size=mines + 1, replace=False)
+
+
+class BoardBank:
+    """
+    Набор заранее сгенерированных досок для воспроизводимых оценок и бенчмарков.
+    Хранится в .npz: positions формы (N, mines+1) и размер поля.
+    """
+
+    def __init__(self, positions, height, width):
+        self.positions = np.asarray(positions)
+        self.height = height
+        self.width = width
+
+    @classmethod
+    def generate(cls, count, height=8, width=8, mines=10, seed=0):
+        rng = np.random.default_rng(seed)
+        return cls([generate_board(rng, height, width, mines) for _ in range(count)], height, width)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["positions"], int(data["height"]), int(data["width"]))
+
+    def save(self, path):
+        # Через файловый объект, чтобы np.savez не дописывал .npz к имени
+        with open(path, "wb") as f:
+            np.savez(f, positions=self.positions, height=self.height, width=self.width)
+
+    @property
+    def mine_count(self):
+        return self.positions.shape[1] - 1
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        return self.positions[index]
+
+
+class MinesweeperEngine:
+    """
+    Headless-движок Сапера на NumPy с тем же интерфейсом, что и MinesweeperBotWeb.
+    Повторяет правила winmine.html: генерация mines+1 позиций (последняя — запасная),
+    перенос мины при первом клике, flood fill по нулям и победа по числу открытых клеток.
+    """
+
+    def __init__(self, height=8, width=8, mines=10, seed=None):
+        self.height = height
+        self.width = width
+        self.mine_count = mines
+        self.rng = np.random.default_rng(seed)
+        self.mines = None
+        self.counts = None
+        self.revealed = None
+        self.flagged = None
+        self.field = None
+        self.backup = None
+        self.cleared = 0
+        self.game_state = "inprogress"
+
+    def start_game(self):
+        """Создание первой доски"""
+        self._new_board()
+
+    def restart_game(self, board=None):
+        """
+        Новая доска вместо клика по смайлику.
+        :param board: позиции мин из generate_board; если не задана, доска генерируется своим генератором.
+        """
+        self._new_board(board)
+
+    def _new_board(self, positions=None):
+        if positions is None:
+            positions = generate_board(self.rng, self.height, self.width, self.mine_count)
+        self.mines = np.zeros((self.height, self.width), dtype=bool)
+        self.mines.flat[positions[:-1]] = True
+        self.backup = divmod(int(positions[-1]), self.width)
+        self.counts = count_neighbor_mines(self.mines)
+        self.revealed = np.zeros((self.height, self.width), dtype=bool)
+        self.flagged = np.zeros((self.height, self.width), dtype=bool)
+        self.field = np.full((self.height, self.width), CLOSED_CELL, dtype=np.int32)
+        self.cleared = 0
+        self.game_state = "inprogress"
+
+    def left_click(self, x, y):
+        """Открытие клетки (x — строка, y — столбец, как в id cell_x_y)"""
+        if self.game_state != "inprogress" or self.revealed[x, y] or self.flagged[x, y]:
+            return
+        if self.mines[x, y]:
+            if self.cleared > 0:
+                self._finish("lose")
+                return
+            # Первый клик по мине: мина переезжает на запасную позицию
+            self.mines[x, y] = False
+            self.mines[self.backup] = True
+            self.counts = count_neighbor_mines(self.mines)
+        self._flood_fill(x, y)
+        if self.cleared >= self.height * self.width - self.mine_count:
+            self._finish("win")
+
+    def right_click(self, x, y):
+        """Установка или снятие флага на закрытой клетке"""
+        if self.game_state != "inprogress" or self.revealed[x, y]:
+            return
+        self.flagged[x, y] = not self.flagged[x, y]
+        self.field[x, y] = FLAG_CELL if self.flagged[x, y] else CLOSED_CELL
+
+    def _flood_fill(self, x, y):
+        stack = [(x, y)]
+        while stack:
+            row, col = stack.pop()
+            if self.revealed[row, col] or self.flagged[row, col]:
+                continue
+            self.revealed[row, col] = True
+            self.cleared += 1
+            value = self.counts[row, col]
+            self.field[row, col] = value
+            if value != 0:
+                continue
+            for r in range(max(row - 1, 0), min(row + 2, self.height)):
+                for c in range(max(col - 1, 0), min(col + 2, self.width)):
+                    if not self.revealed[r, c]:
+                        stack.append((r, c))
+
+    def _finish(self, state):
+        self.game_state = state
+        # Как на странице: при победе на все мины ставятся флаги, при проигрыше открываются
+        # мины без флагов, а ошибочные флаги получают класс notmine (-77)
+        if state == "win":
+            self.field[self.mines] = FLAG_CELL
+        else:
+            self.field[self.mines & ~self.flagged] = MINE_CELL
+            self.field[self.flagged & ~self.mines] = MINE_CELL
+
+    def get_game_state(self):
+        return self.game_state
+
+    def get_field_state(self):
+        return self.field.copy()
+
+    def observe(self):
+        return GameSnapshot(self.get_field_state(), self.game_state)
+
+    def left_click_and_observe(self, x, y):
+        self.left_click(x, y)
+        return self.observe()
+
+    def left_clicks_and_observe(self, cells):
+        for x, y in cells:
+            self.left_click(x, y)
+        return self.observe()
+
+    def close_game(self):
+        """Для совместимости с MinesweeperBotWeb: ресурсов для освобождения нет"""
+        pass
@@ -0,0 +1,259 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL
+from src.minesweeper_solver import cell_neighbors, find_forced_moves
+
+
+class _TooManyNodes(Exception):
+    pass
+
+
+def _log_comb_row(n):
+    """log C(n, k) для k = 0..n"""
+    steps = np.log(np.arange(n, 0, -1, dtype=np.float64)) - np.log(np.arange(1, n + 1, dtype=np.float64))
+    return np.concatenate([[0.0], np.cumsum(steps)])
+
+
+def _log_convolve(a, b):
+    """Свёртка распределений по числу мин, заданных логарифмами весов"""
+    top_a, top_b = a.max(), b.max()
+    if not np.isfinite(top_a) or not np.isfinite(top_b):
+        return np.full(len(a) + len(b) - 1, -np.inf)
+    with np.errstate(divide="ignore"):
+        return np.log(np.convolve(np.exp(a - top_a), np.exp(b - top_b))) + top_a + top_b
+
+
+def _normalize(log_weights):
+    top = log_weights.max()
+    if not np.isfinite(top):
+        return None
+    weights = np.exp(log_weights - top)
+    return weights / weights.sum()
+
+
+class MineProbabilityEngine:
+    """
+    Вероятность мины в каждой закрытой клетке по текущему полю.
+    Фронтир (закрытые клетки рядом с числами) делится на независимые связные компоненты;
+    маленькие перебираются точно, большие оцениваются последовательной выборкой по значимости.
+    Компоненты взвешиваются между собой и с внутренними клетками по общему числу мин.
+    Результаты компонент кэшируются по их ограничениям, поэтому после хода пересчитывается
+    только та часть фронтира, которую этот ход изменил.
+    """
+
+    def __init__(self, max_exact_nodes=200000, samples=2000, cache_size=4096, seed=None):
+        """
+        :param max_exact_nodes: предел узлов перебора одной компоненты, после которого она оценивается выборкой.
+        :param samples: число выборок для большой компоненты.
+        :param cache_size: сколько компонент хранить в кэше.
+        """
+        self.max_exact_nodes = max_exact_nodes
+        self.samples = samples
+        self.cache_size = cache_size
+        self.rng = np.random.default_rng(seed)
+        self.cache = OrderedDict()
+
+    def probabilities(self, field, mines):
+        """
+        :param field: поле (H, W) в кодах get_field_state.
+        :param mines: общее число мин на доске (параметр mines страницы); флаги считаются верными.
+        :return: массив float64 (H, W): 0 для открытых клеток, 1 для флагов и выведенных мин.
+        """
+        field = np.asarray(field)
+        height, width = field.shape
+        flat = field.ravel()
+        flags = flat == FLAG_CELL
+        safe, forced = find_forced_moves(field, mines - int(flags.sum()))
+        safe, forced = safe.ravel(), forced.ravel()
+        known = flags | forced
+        unknown = (flat == CLOSED_CELL) & ~safe & ~forced
+
+        result = np.zeros(height * width)
+        result[known] = 1.0
+        remaining = mines - int(known.sum())
+
+        # Ограничения фронтира на ещё не определённые клетки; одинаковые ограничения от разных чисел сливаются
+        neighbors = cell_neighbors(height, width)
+        constraints = set()
+        for cell in np.flatnonzero((flat >= 0) & (flat <= 8)).tolist():
+            cells = tuple(neighbor for neighbor in neighbors[cell] if unknown[neighbor])
+            if cells:
+                need = int(flat[cell]) - sum(1 for neighbor in neighbors[cell] if known[neighbor])
+                constraints.add((cells, need))
+
+        components = self._components(constraints)
+        frontier = np.zeros(height * width, dtype=bool)
+        solved = []
+        for component in components:
+            cells, log_weights, conditional = self._solve_cached(component)
+            frontier[list(cells)] = True
+            solved.append((cells, log_weights, conditional))
+
+        interior = np.flatnonzero(unknown & ~frontier)
+        log_comb = _log_comb_row(len(interior))
+
+        total = np.zeros(1)
+        for _, log_weights, _ in solved:
+            total = _log_convolve(total, log_weights)
+        # log C(I, R - K): способы разместить оставшиеся мины во внутренних клетках при K минах на фронтире
+        left = remaining - np.arange(len(total))
+        interior_weights = np.full(len(total), -np.inf)
+        valid = (left >= 0) & (left <= len(interior))
+        interior_weights[valid] = log_comb[left[valid]]
+        distribution = _normalize(total + interior_weights)
+
+        for index, (cells, log_weights, conditional) in enumerate(solved):
+            posterior = None
+            if distribution is not None:
+                others = np.zeros(1)
+                for other, (_, other_weights, _) in enumerate(solved):
+                    if other != index:
+                        others = _log_convolve(others, other_weights)
+                # Вес k мин в компоненте: решения остальных компонент и внутренних клеток при оставшихся минах
+                combined = np.array([np.logaddexp.reduce(others + interior_weights[k:k + len(others)])
+                                     for k in range(len(log_weights))])
+                posterior = _normalize(log_weights + combined)
+            if posterior is None:
+                # Число мин противоречит полю (например, ошибочные флаги) — компонента без учёта общего числа
+                posterior = _normalize(log_weights)
+            result[list(cells)] = posterior @ conditional
+
+        if len(interior):
+            if distribution is None:
+                result[interior] = min(max(remaining, 0) / len(interior), 1.0)
+            else:
+                result[interior] = distribution @ left / len(interior)
+        return result.reshape(height, width)
+
+    @staticmethod
+    def _components(constraints):
+        """Разбиение ограничений на связные компоненты по общим клеткам"""
+        parent = {}
+
+        def find(cell):
+            while parent[cell] != cell:
+                parent[cell] = parent[parent[cell]]
+                cell = parent[cell]
+            return cell
+
+        for cells, _ in constraints:
+            for cell in cells:
+                parent.setdefault(cell, cell)
+            root = find(cells[0])
+            for cell in cells[1:]:
+                parent[find(cell)] = root
+
+        groups = {}
+        for constraint in constraints:
+            groups.setdefault(find(constraint[0][0]), []).append(constraint)
+        return [tuple(sorted(group)) for group in groups.values()]
+
+    def _solve_cached(self, component):
+        if component in self.cache:
+            self.cache.move_to_end(component)
+            return self.cache[component]
+        solution = self._solve(component)
+        self.cache[component] = solution
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return solution
+
+    def _solve(self, component):
+        """
+        Распределение решений компоненты по числу мин k.
+        :return: (клетки, log числа решений с k минами, P(мина в клетке | k) формы (k_max + 1, клетки)).
+        """
+        # Порядок обхода по ограничениям: соседние клетки назначаются подряд и тупики отсекаются раньше
+        cells = []
+        for constraint_cells, _ in component:
+            for cell in constraint_cells:
+                if cell not in cells:
+                    cells.append(cell)
+        position = {cell: index for index, cell in enumerate(cells)}
+        cell_constraints = [[] for _ in cells]
+        for index, (constraint_cells, _) in enumerate(component):
+            for cell in constraint_cells:
+                cell_constraints[position[cell]].append(index)
+        need = [need for _, need in component]
+        free = [len(constraint_cells) for constraint_cells, _ in component]
+
+        try:
+            counts, hits = self._enumerate(cell_constraints, list(need), list(free))
+        except _TooManyNodes:
+            counts, hits = self._sample(cell_constraints, need, free)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_weights = np.log(counts)
+            conditional = np.where(counts[:, None] > 0, hits / counts[:, None], 0.0)
+        return tuple(cells), log_weights, conditional
+
+    def _enumerate(self, cell_constraints, need, free):
+        """Точный перебор с отсечением: need — сколько мин ещё нужно ограничению, free — сколько клеток не назначено"""
+        size = len(cell_constraints)
+        counts = np.zeros(size + 1)
+        hits = np.zeros((size + 1, size))
+        assignment = [False] * size
+        nodes = 0
+
+        def visit(index, mines):
+            nonlocal nodes
+            nodes += 1
+            if nodes > self.max_exact_nodes:
+                raise _TooManyNodes
+            if index == size:
+                counts[mines] += 1
+                hits[mines] += assignment
+                return
+            constraints = cell_constraints[index]
+            if all(need[c] < free[c] for c in constraints):
+                for c in constraints:
+                    free[c] -= 1
+                visit(index + 1, mines)
+                for c in constraints:
+                    free[c] += 1
+            if all(need[c] > 0 for c in constraints):
+                for c in constraints:
+                    free[c] -= 1
+                    need[c] -= 1
+                assignment[index] = True
+                visit(index + 1, mines + 1)
+                assignment[index] = False
+                for c in constraints:
+                    free[c] += 1
+                    need[c] += 1
+
+        visit(0, 0)
+        return counts, hits
+
+    def _sample(self, cell_constraints, need, free):
+        """
+        Последовательная выборка по значимости: значение каждой клетки выбирается равновероятно из допустимых,
+        решение входит с весом 1 / q, где q — вероятность пути. Оценки числа решений несмещённые.
+        """
+        size = len(cell_constraints)
+        counts = np.zeros(size + 1)
+        hits = np.zeros((size + 1, size))
+        for _ in range(self.samples):
+            left, open_cells = list(need), list(free)
+            assignment = [False] * size
+            weight, mines = 1.0, 0
+            for index, constraints in enumerate(cell_constraints):
+                options = []
+                if all(left[c] < open_cells[c] for c in constraints):
+                    options.append(False)
+                if all(left[c] > 0 for c in constraints):
+                    options.append(True)
+                if not options:
+                    break
+                is_mine = options[self.rng.integers(len(options))] if len(options) > 1 else options[0]
+                weight *= len(options)
+                for c in constraints:
+                    open_cells[c] -= 1
+                    left[c] -= is_mine
+                assignment[index] = is_mine
+                mines += is_mine
+            else:
+                counts[mines] += weight
+                hits[mines] += np.multiply(assignment, weight)
+        return counts / self.samples, hits / self.samples
@@ -0,0 +1,121 @@
+from functools import lru_cache
+
+import numpy as np
+
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL
+
+
+@lru_cache(maxsize=None)
+def cell_neighbors(height, width):
+    """Плоские индексы соседей каждой клетки"""
+    result = []
+    for row in range(height):
+        for col in range(width):
+            result.append([r * width + c
+                           for r in range(max(row - 1, 0), min(row + 2, height))
+                           for c in range(max(col - 1, 0), min(col + 2, width))
+                           if (r, c) != (row, col)])
+    return result
+
+
+def _bits(mask):
+    """Плоские индексы установленных битов маски"""
+    cells = []
+    while mask:
+        low = mask & -mask
+        cells.append(low.bit_length() - 1)
+        mask ^= low
+    return cells
+
+
+def find_forced_moves(field, mines_left=None):
+    """
+    Клетки, которые точно безопасны и точно заминированы, по текущему полю в кодах контроллера.
+    Правила: одиночное (число == закрытые соседи или все мины вокруг числа уже известны),
+    попарное по ограничениям фронтира (вложенные и пересекающиеся множества) и общее число мин.
+    :param field: поле (H, W) в кодах get_field_state: 99 — закрыта, -1 — флаг, 0..8 — открыта.
+    :param mines_left: сколько мин ещё не помечено флагами (общее число мин минус флаги на поле);
+                       если известно, используется глобальное правило.
+    :return: (safe, mines) — булевы массивы (H, W).
+    """
+    field = np.asarray(field)
+    height, width = field.shape
+    neighbors = cell_neighbors(height, width)
+    flat = field.ravel()
+
+    unknown = set(np.flatnonzero(flat == CLOSED_CELL).tolist())
+    mines = set(np.flatnonzero(flat == FLAG_CELL).tolist())
+    safe = set()
+    numbers = np.flatnonzero((flat >= 0) & (flat <= 8)).tolist()
+
+    changed = True
+    while changed:
+        changed = False
+        # Ограничения фронтира: маска закрытых соседей и сколько мин среди них осталось
+        constraints = {}
+        for cell in numbers:
+            cells = 0
+            remaining = int(flat[cell])
+            for neighbor in neighbors[cell]:
+                if neighbor in mines:
+                    remaining -= 1
+                elif neighbor in unknown:
+                    cells |= 1 << neighbor
+            if cells:
+                constraints[cells] = remaining
+
+        new_safe, new_mines = 0, 0
+        for cells, remaining in constraints.items():
+            if remaining == 0:
+                new_safe |= cells
+            elif remaining == cells.bit_count():
+                new_mines |= cells
+
+        # Попарные правила для ограничений A и B с общими клетками: в A ∩ B не меньше rA - |A \ B| мин.
+        # Если эта граница равна rB, то все мины B лежат в пересечении: B \ A безопасны, A \ B — мины.
+        # Для вложенного A ⊆ B с rA == rB это даёт безопасный остаток B
+        if not new_safe and not new_mines:
+            items = list(constraints.items())
+            by_cell = {}
+            for index, (cells, _) in enumerate(items):
+                for cell in _bits(cells):
+                    by_cell.setdefault(cell, []).append(index)
+            seen = set()
+            for group in by_cell.values():
+                for i in group:
+                    for j in group:
+                        if i == j or (i, j) in seen:
+                            continue
+                        seen.add((i, j))
+                        a, ra = items[i]
+                        b, rb = items[j]
+                        only_a = a & ~b
+                        if ra - only_a.bit_count() == rb:
+                            new_safe |= b & ~a
+                            new_mines |= only_a
+
+        # Глобальное правило по общему числу мин
+        if not new_safe and not new_mines and mines_left is not None and unknown:
+            left = mines_left - (len(mines) - int((flat == FLAG_CELL).sum()))
+            if left == 0:
+                new_safe = sum(1 << cell for cell in unknown)
+            elif left == len(unknown):
+                new_mines = sum(1 << cell for cell in unknown)
+
+        for cell in _bits(new_safe):
+            if cell in unknown:
+                unknown.discard(cell)
+                safe.add(cell)
+                changed = True
+        for cell in _bits(new_mines):
+            if cell in unknown:
+                unknown.discard(cell)
+                mines.add(cell)
+                changed = True
+
+    safe_mask = np.zeros(height * width, dtype=bool)
+    safe_mask[list(safe)] = True
+    mine_mask = np.zeros(height * width, dtype=bool)
+    mine_mask[list(mines)] = True
+    mine_mask[flat == FLAG_CELL] = False
+    return safe_mask.reshape(height, width), mine_mask.reshape(height, width)
@@ -0,0 +1,60 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from src.learning.inference_server import InferenceServer
+from src.learning.ppo_env.factory import EnvFactory
+
+SEEDS = range(5)
+
+
+def _observations():
+    env = EnvFactory("engine", observation_mode="compact")()
+    observations = []
+    for seed in SEEDS:
+        observation, _ = env.reset(seed=seed)
+        observations.append((observation, env.action_masks()))
+        observation, _, _, _, _ = env.step(int(np.flatnonzero(env.action_masks())[0]))
+        observations.append((observation, env.action_masks()))
+    env.close()
+    return observations
+
+
+def _client(handle, results):
+    client = handle.connect()
+    results.put([client.predict(observation, masks) for observation, masks in _observations()])
+    client.close()
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    from sb3_contrib import MaskablePPO
+
+    env = EnvFactory("engine", observation_mode="compact")()
+    path = str(tmp_path_factory.mktemp("inference") / "model.zip")
+    MaskablePPO("MultiInputPolicy", env, n_steps=32, batch_size=32, seed=0, device="cpu").save(path)
+    env.close()
+    return path
+
+
+@pytest.mark.parametrize("start_method", ["spawn", "fork"])
+def test_round_trip_matches_predict(checkpoint, start_method):
+    from sb3_contrib import MaskablePPO
+
+    model = MaskablePPO.load(checkpoint, device="cpu")
+    expected = [int(model.predict(observation, deterministic=True, action_masks=masks)[0])
+                for observation, masks in _observations()]
+
+    # Клиент и сервер — отдельные процессы: ответы должны проходить через разделяемую память при любом методе запуска
+    context = multiprocessing.get_context(start_method)
+    server = InferenceServer(checkpoint, maskable=True, slots=2, mp_context=start_method).start()
+    try:
+        results = context.Queue()
+        process = context.Process(target=_client, args=(server.handle, results))
+        process.start()
+        actions = results.get(timeout=120)
+        process.join()
+    finally:
+        server.close()
+    assert actions == expected
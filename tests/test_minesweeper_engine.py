@@ -0,0 +1,49 @@
+import numpy as np
+
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL, MINE_CELL, MinesweeperEngine, count_neighbor_mines
+
+HEIGHT, WIDTH = 4, 4
+
+# Мины в (0, 0) и (0, 1), запасная клетка (3, 3) — формат generate_board
+BOARD = np.array([0, 1, 15])
+
+
+def _engine():
+    engine = MinesweeperEngine(HEIGHT, WIDTH, mines=2)
+    engine.restart_game(board=BOARD)
+    return engine
+
+
+def test_first_click_on_mine_moves_it_to_backup():
+    # winmine.html: при cleared == 0 мина из клетки клика переезжает на запасную, клетка открывается
+    engine = _engine()
+    snapshot = engine.left_click_and_observe(0, 0)
+    assert snapshot.game_state == "inprogress"
+    assert not engine.mines[0, 0] and engine.mines[3, 3] and engine.mines[0, 1]
+    assert engine.mines.sum() == 2
+    np.testing.assert_array_equal(engine.counts, count_neighbor_mines(engine.mines))
+    assert snapshot.field_state[0, 0] == 1
+    assert snapshot.field_state[3, 3] == CLOSED_CELL
+
+
+def test_mine_after_first_click_loses():
+    engine = _engine()
+    engine.left_click(1, 1)
+    engine.right_click(2, 2)
+    snapshot = engine.left_click_and_observe(0, 0)
+    assert snapshot.game_state == "lose"
+    # Мины открываются, ошибочный флаг получает класс notmine
+    assert snapshot.field_state[0, 0] == MINE_CELL and snapshot.field_state[0, 1] == MINE_CELL
+    assert snapshot.field_state[2, 2] == MINE_CELL
+
+
+def test_win_flags_all_mines():
+    engine = _engine()
+    # Клик по нулю открывает всё, кроме мин и клеток, отделённых ими
+    snapshot = engine.left_click_and_observe(3, 3)
+    for x, y in np.argwhere(snapshot.field_state == CLOSED_CELL):
+        if not engine.mines[x, y]:
+            snapshot = engine.left_click_and_observe(x, y)
+    assert snapshot.game_state == "win"
+    assert (snapshot.field_state[engine.mines] == FLAG_CELL).all()
+    assert engine.cleared == HEIGHT * WIDTH - 2
@@ -0,0 +1,57 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL, MinesweeperEngine, count_neighbor_mines
+from src.minesweeper_probability import MineProbabilityEngine
+
+HEIGHT, WIDTH, MINES = 5, 5, 4
+
+
+def _positions(seed, moves):
+    """Поле посреди партии: первый клик в центр, затем moves случайных безопасных кликов"""
+    rng = np.random.default_rng(seed)
+    engine = MinesweeperEngine(HEIGHT, WIDTH, MINES, seed=seed)
+    engine.start_game()
+    engine.left_click(HEIGHT // 2, WIDTH // 2)
+    for _ in range(moves):
+        if engine.game_state != "inprogress":
+            break
+        safe = np.argwhere(~engine.revealed & ~engine.mines)
+        engine.left_click(*safe[rng.integers(len(safe))])
+    return engine
+
+
+def _brute_force(field, mines):
+    """Точные вероятности перебором всех расстановок мин, согласованных с числами и флагами"""
+    flags = field == FLAG_CELL
+    closed = np.flatnonzero(field == CLOSED_CELL)
+    numbers = (field >= 0) & (field <= 8)
+    hits = np.zeros(field.size)
+    total = 0
+    for chosen in combinations(closed, mines - int(flags.sum())):
+        board = flags.copy()
+        board.flat[list(chosen)] = True
+        if np.array_equal(count_neighbor_mines(board)[numbers], field[numbers]):
+            hits[list(chosen)] += 1
+            total += 1
+    probabilities = hits.reshape(field.shape) / total
+    probabilities[flags] = 1.0
+    return probabilities
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_exact_probabilities_match_brute_force(seed):
+    engine = _positions(seed, moves=seed % 3)
+    if engine.game_state != "inprogress":
+        pytest.skip("the game ended before a position with closed cells")
+    # Часть мин помечена флагами: они учитываются в общем числе мин
+    flagged = np.argwhere(engine.mines)[:seed % 2]
+    for x, y in flagged:
+        engine.right_click(x, y)
+    field = engine.get_field_state()
+
+    expected = _brute_force(field, MINES)
+    actual = MineProbabilityEngine(seed=0).probabilities(field, MINES)
+    np.testing.assert_allclose(actual, expected, atol=1e-9)
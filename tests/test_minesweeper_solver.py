@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from src.minesweeper_engine import CLOSED_CELL, FLAG_CELL, MinesweeperEngine
+from src.minesweeper_solver import find_forced_moves
+
+HEIGHT, WIDTH, MINES = 8, 8, 10
+
+
+@pytest.mark.parametrize("flags", [False, True])
+def test_forced_moves_are_sound(flags):
+    # Играем выведенными ходами до конца: безопасные клетки никогда не мины, выведенные мины — всегда мины
+    checked = 0
+    for seed in range(50):
+        engine = MinesweeperEngine(HEIGHT, WIDTH, MINES, seed=seed)
+        engine.start_game()
+        engine.left_click(HEIGHT // 2, WIDTH // 2)
+        while engine.game_state == "inprogress":
+            field = engine.get_field_state()
+            safe, mines = find_forced_moves(field, MINES - int((field == FLAG_CELL).sum()))
+            assert not (safe & engine.mines).any()
+            assert (engine.mines[mines]).all()
+            checked += int(safe.sum() + mines.sum())
+            if flags:
+                for x, y in np.argwhere(mines & ~engine.flagged):
+                    engine.right_click(x, y)
+            if not safe.any():
+                break
+            for x, y in np.argwhere(safe):
+                engine.left_click(x, y)
+    assert checked > 0
+
+
+def test_global_count_with_flags():
+    # Единственная мина уже помечена: обе закрытые клетки безопасны только по общему числу мин
+    field = np.array([[FLAG_CELL, CLOSED_CELL, CLOSED_CELL]])
+    safe, _ = find_forced_moves(field, 0)
+    assert safe.tolist() == [[False, True, True]]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from src.learning.ppo_env.factory import EnvFactory
+from src.learning.ppo_env.sweeper_vec_env import MinesweeperVecEnv
+from src.minesweeper_engine import BoardBank
+
+NUM_ENVS, HEIGHT, WIDTH, MINES = 16, 6, 6, 6
+
+
+def _board(vec_env, index):
+    """Позиции доски index векторного окружения в формате generate_board: мины, затем запасная клетка"""
+    backup = vec_env.backup[index, 0] * WIDTH + vec_env.backup[index, 1]
+    return np.append(np.flatnonzero(vec_env.mines[index]), backup)
+
+
+def _restart(env, board):
+    env.board_bank = BoardBank([board], HEIGHT, WIDTH)
+    observation, _ = env.reset(options={"board_index": 0})
+    return observation
+
+
+@pytest.mark.parametrize("observation_mode", ["raw", "compact"])
+def test_matches_single_env(observation_mode):
+    # Каждая доска векторного окружения повторяется в MinesweeperEnv с движком теми же действиями
+    rng = np.random.default_rng(0)
+    vec_env = MinesweeperVecEnv(NUM_ENVS, HEIGHT, WIDTH, MINES, seed=0, observation_mode=observation_mode)
+    vec_observation = vec_env.reset()
+    envs = [EnvFactory("engine", observation_mode=observation_mode, height=HEIGHT, width=WIDTH, mines=MINES)()
+            for _ in range(NUM_ENVS)]
+    observations = [_restart(env, _board(vec_env, i)) for i, env in enumerate(envs)]
+    finished = 0
+    for _ in range(300):
+        for i, observation in enumerate(observations):
+            np.testing.assert_array_equal(vec_observation['field_state'][i], observation['field_state'])
+            assert vec_observation['game_state'][i] == observation['game_state']
+
+        # Чаще всего — закрытая клетка без мины, чтобы партии доходили до победы; иногда — любая клетка,
+        # в том числе мина (проигрыш или перенос мины первым кликом) и уже открытая (штраф без изменения доски)
+        safe = vec_env.action_masks() & ~vec_env.mines.reshape(NUM_ENVS, -1)
+        random_cells = rng.integers(HEIGHT * WIDTH, size=NUM_ENVS)
+        safe_cells = np.argmax(rng.random(safe.shape) * safe, axis=1)
+        actions = np.where(rng.random(NUM_ENVS) < 0.1, random_cells, safe_cells)
+
+        vec_observation, rewards, dones, infos = vec_env.step(actions)
+        for i, env in enumerate(envs):
+            observation, reward, terminated, _, _ = env.step(actions[i])
+            assert rewards[i] == reward
+            assert dones[i] == terminated
+            if terminated:
+                terminal = infos[i]["terminal_observation"]
+                np.testing.assert_array_equal(terminal['field_state'], observation['field_state'])
+                assert terminal['game_state'] == observation['game_state']
+                observation = _restart(env, _board(vec_env, i))
+                finished += 1
+            observations[i] = observation
+    assert finished > NUM_ENVS and vec_env.wins > 0
+    assert vec_env.wins == sum(env.wins for env in envs)
+    assert vec_env.loses == sum(env.loses for env in envs)
+    vec_env.close()
+    for env in envs:
+        env.close()